@@ -1,50 +1,109 @@
-import shutil
-import tempfile
-from flask import Flask, render_template, request, redirect, send_file
+from flask import Flask, Response, g, render_template, request, redirect, send_file, jsonify, url_for
 from werkzeug.utils import secure_filename
-import threading
+import batch
 import velLogScript
+import charter
+import jobs
+import resultcache
+import logstore
+import instrumentation
+import metrics
+import workspace
+import uploads
+import ingest
+import concurrent.futures
+import hashlib
+import multiprocessing
 import os
-import zipfile
 import time
-import random
+import zipfile
 
-def allowed_file(filename):
-    return '.' in filename and \
-           filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
+class ArchiveError(Exception):
+    ''' Raised when a finished workbook can't be added to the results zip. '''
 
 
-def threadedFileCleanup():
-    print("trying to clean up file structure")
-    if numberOfActiveRequests == 0:
-        try:
-            shutil.rmtree('datafiles')
-            os.makedirs('datafiles/downloads')
-            os.makedirs('datafiles/uploads')
-        except:
-            print('fatal error on automatically cleaning server tree, make sure file structure is intact')
-            exit 
-    time.sleep(3600)
-    threadedFileCleanup()
+def allowed_file(filename):
+    return filename.lower().endswith(tuple('.' + extension for extension in ALLOWED_EXTENSIONS))
 
 
 #necessary variables
 app = Flask(__name__)
-ALLOWED_EXTENSIONS = {'csv'}
-numberOfActiveRequests = 0
-fileCleaner = threading.Thread(name="Cleaner", target=threadedFileCleanup)
-fileCleaner.daemon = True
-fileCleaner.start()
-
-
-#initial cleanup on startup 
-try:
-    shutil.rmtree('datafiles')
-    os.makedirs('datafiles/downloads')
-    os.makedirs('datafiles/uploads')
-except:
-    print('fatal error on server startup cleaning server tree, make sure file structure is intact')
-    exit 
+ALLOWED_EXTENSIONS = {suffix[1:] for suffix in ingest.logSuffixes} # Plain or compressed CSV logs, decompressed while they are read
+ANALYSIS_WORKERS = 2 # Number of uploads analyzed at the same time
+MAX_QUEUED_JOBS = 10 # Number of uploads that can wait for a free worker before new ones are turned away
+WORKSPACE_ROOT = 'datafiles'
+WORKSPACE_MAX_AGE_SECONDS = 3600 # Time the files of a job are kept after they were last used, so the result can still be downloaded
+WORKSPACE_SWEEP_SECONDS = 600 # Time between sweeps for expired workspaces
+RESULT_CACHE_DIR = 'resultcache' # Kept outside of the workspace root so sweeping doesn't touch it
+RESULT_CACHE_MAX_BYTES = 500 * 1024 * 1024
+MAX_UPLOAD_BYTES = 1024 * 1024 * 1024 # Largest log file accepted
+UPLOAD_MAX_AGE_SECONDS = 3600 # Time a chunked upload is kept without receiving a chunk, so a client on a slow link can resume
+MAX_BATCH_FILES = 200 # Largest number of log files in one multi-file upload
+BATCH_WORKERS = 4 # Number of processes analyzing the files of one multi-file upload at the same time
+PARSED_LOG_DIR = 'parsedlogs' # Parsed uploads, so a file analyzed again with another profile or analyzer version isn't parsed again
+PARSED_LOG_MAX_BYTES = 2 * 1024 * 1024 * 1024
+INSTRUMENTATION_LOG = None # File to write timed spans of every upload to as JSON lines, None to turn instrumentation off
+INSTRUMENTATION_PROFILE_DIR = None # Folder to write a cProfile .prof file of every analysis to, None to not profile
+INSTRUMENTATION_TRACE_MEMORY = False # Whether to add the memory allocated by every stage to its span with tracemalloc
+if INSTRUMENTATION_LOG is not None:
+    instrumentation.configure(INSTRUMENTATION_LOG, INSTRUMENTATION_PROFILE_DIR, INSTRUMENTATION_TRACE_MEMORY)
+analysisQueue = jobs.JobQueue(ANALYSIS_WORKERS, MAX_QUEUED_JOBS, WORKSPACE_MAX_AGE_SECONDS)
+resultCache = resultcache.ResultCache(RESULT_CACHE_DIR, RESULT_CACHE_MAX_BYTES, velLogScript.analyzerVersion)
+parsedLogs = logstore.LogStore(PARSED_LOG_DIR, PARSED_LOG_MAX_BYTES)
+workspaces = workspace.WorkspaceManager(WORKSPACE_ROOT, WORKSPACE_MAX_AGE_SECONDS, WORKSPACE_SWEEP_SECONDS) # Startup cleanup of leftover files happens here
+workspaces.start()
+# Batch workers are started without forking the server, whose other threads may hold locks the children would inherit
+batchProcesses = multiprocessing.get_context("forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn")
+chunkedUploads = uploads.UploadManager(workspaces, UPLOAD_MAX_AGE_SECONDS)
+workspaces.beforeSweep.append(chunkedUploads.prune) # Otherwise abandoned uploads are only dropped when another one starts
+app.config['MAX_CONTENT_LENGTH'] = MAX_UPLOAD_BYTES + 1024 * 1024 # Room for the multipart headers of /uploader
+
+#METRICS
+registry = metrics.Registry()
+requestsTotal = registry.register(metrics.Counter("vellog_http_requests_total", "HTTP requests by route, method and status code", ("route", "method", "status")))
+requestSeconds = registry.register(metrics.Histogram("vellog_http_request_duration_seconds", "Time to build the response of a request by route", ("route",)))
+uploadBytes = registry.register(metrics.Counter("vellog_upload_bytes_total", "Bytes of log files uploaded"))
+rowsRead = registry.register(metrics.Counter("vellog_rows_read_total", "Rows of the sequences read from uploaded log files"))
+sequencesAnalyzed = registry.register(metrics.Counter("vellog_sequences_analyzed_total", "Sequences analyzed by outcome", ("status",)))
+jobsCompleted = registry.register(metrics.Counter("vellog_jobs_completed_total", "Analysis jobs that finished by outcome", ("status",)))
+stageSeconds = registry.register(metrics.Histogram("vellog_stage_duration_seconds", "Time spent in each stage of the analysis", ("stage",)))
+registry.register(metrics.Callback("vellog_jobs", "Analysis jobs waiting for a worker (queued) and being analyzed (running)", "gauge",
+    lambda: {(state,): count for state, count in analysisQueue.counts().items() if state in (jobs.queuedState, jobs.runningState)}, ("state",)))
+registry.register(metrics.Callback("vellog_uploads_in_progress", "Chunked uploads started but not completed", "gauge", chunkedUploads.activeCount))
+registry.register(metrics.Callback("vellog_active_workspaces", "Workspaces in use by a request or job", "gauge", workspaces.activeCount))
+registry.register(metrics.Callback("vellog_workspace_sweeps_total", "Sweeps for expired workspaces", "counter", lambda: workspaces.sweeps))
+registry.register(metrics.Callback("vellog_workspaces_swept_total", "Workspaces deleted by sweeps", "counter", lambda: workspaces.swept))
+registry.register(metrics.Callback("vellog_workspace_sweep_errors_total", "Sweeps that failed", "counter", lambda: workspaces.sweepErrors))
+for stat, kind in (("hits", "counter"), ("misses", "counter"), ("evictions", "counter"), ("entries", "gauge"), ("bytes", "gauge")):
+    registry.register(metrics.Callback("vellog_result_cache_" + stat + ("_total" if kind == "counter" else ""), "Result cache " + stat, kind,
+        lambda stat=stat: resultCache.stats()[stat]))
+
+
+def recordSpan(record):
+    ''' Turn a finished instrumentation span into metrics. '''
+    stageSeconds.observe(record["seconds"], stage=record["name"])
+    if record["name"] == "readSequence" and "rows" in record:
+        rowsRead.inc(record["rows"])
+    elif record["name"] == "sequence":
+        sequencesAnalyzed.inc(status=record["status"])
+    elif record["name"] in ("analyzeUpload", "analyzeBatch"):
+        jobsCompleted.inc(status=record["status"])
+
+
+instrumentation.addListener(recordSpan)
+
+
+@app.before_request
+def startTimer():
+    g.requestStart = time.perf_counter()
+
+
+@app.after_request
+def countRequest(response):
+    route = request.url_rule.rule if request.url_rule is not None else "unmatched" # Not the path, so job IDs don't make a series each
+    requestsTotal.inc(route=route, method=request.method, status=response.status_code)
+    requestSeconds.observe(time.perf_counter() - g.requestStart, route=route)
+    return response
 
 #SITE ROUTES
 @app.route("/")
@@ -52,59 +111,360 @@ def index():
     return render_template("index.html")
 
 @app.route('/uploader', methods = ['POST'])
+@instrumentation.timed("upload")
 def upload_file():
-    global numberOfActiveRequests
-    randId = random.randint(1, 1000000000)
+    ''' Save the uploaded log file and queue it for analysis. Returns the job ID and the URLs to poll for its status and result. '''
     if request.method == 'POST' and 'file' in request.files:
         f = request.files['file']
         if f.filename == '':
             return 'No selected file', 400
         if not allowed_file(f.filename):
             return 'File type not allowed', 400
-    
+        profile = request.form.get('profile', charter.fullProfile)
+        if profile not in charter.profiles:
+            return 'Unknown export profile', 400
+        if analysisQueue.isFull():
+            return 'Too many files are waiting to be processed, please try again later', 503
+
         else:
-            numberOfActiveRequests = numberOfActiveRequests + 1 
-            os.mkdir(f"datafiles/uploads/{randId}")
-            os.mkdir(f"datafiles/downloads/{randId}")
+            # The reference to the workspace taken here is handed to the job, which releases it when it is done.
+            upload = uploads.Upload(workspaces.create(), secure_filename(f.filename))
             try:
-                f.save(f"datafiles/uploads/{randId}/{secure_filename(f.filename)}")
-            except:
-                numberOfActiveRequests = numberOfActiveRequests - 1 
-                return "error saving file"
-            
-            try:
-                v = velLogScript.velLogScript()
-                filepath = os.path.join(os.path.dirname(os.path.abspath(__file__)) + f"\\datafiles\\uploads\\{randId}", secure_filename(f.filename))
-                v.main(filepath)
+                with instrumentation.span("receive"):
+                    upload.append(f.stream, 0, MAX_UPLOAD_BYTES)
+            except uploads.UploadTooLargeError as e:
+                workspaces.discard(upload.workspace)
+                return str(e), 413
             except Exception as e:
-                print(repr(e))
-                numberOfActiveRequests = numberOfActiveRequests - 1
-                return "error running analysis script on supplied file"
-            
-            try:
-                os.remove(filepath)
-                path = os.path.join(os.path.dirname(os.path.abspath(__file__)) + f"\\datafiles\\downloads\\{randId}", 'results.zip')
-
-                zipf = zipfile.ZipFile(path,'w', zipfile.ZIP_DEFLATED)
-                for root,dirs, files in os.walk(os.path.dirname(os.path.abspath(__file__)) + f"\\datafiles\\uploads\\{randId}"):
-                    for file in files:
-                        zipf.write(os.path.join(root,file), arcname=file)
-                        os.remove(os.path.join(root, file))
-                zipf.close()
-            except:
-                numberOfActiveRequests = numberOfActiveRequests - 1
-                return "error writing zip file with results"
-
-            
-            cache = tempfile.NamedTemporaryFile()
-            with open(path, 'rb') as fp:
-                shutil.copyfileobj(fp, cache)
-                cache.flush()
-            cache.seek(0)
-            os.remove(path)
-            os.rmdir(f"datafiles/uploads/{randId}")
-            os.rmdir(f"datafiles/downloads/{randId}")
-            numberOfActiveRequests = numberOfActiveRequests - 1
-            return send_file(cache, as_attachment=True, download_name='result.zip')
-      
-   
\ No newline at end of file
+                print("Error saving uploaded file: " + repr(e))
+                workspaces.discard(upload.workspace)
+                return "error saving file", 500
+            uploadBytes.inc(upload.received)
+            return queueAnalysis(upload, profile)
+    return 'No file uploaded', 400
+
+@app.route('/uploads', methods = ['POST'])
+def start_upload():
+    '''
+    Start a chunked upload of a log file. Takes filename and optionally size (total bytes) as JSON or form fields.
+
+    Returns the upload's status and the URL to send its chunks to. Each chunk is PATCHed to that URL as the raw request
+    body with an Upload-Offset header saying where in the file it starts.
+    '''
+    fields = request.get_json(silent=True) or request.form
+    filename = secure_filename(str(fields.get('filename', '')))
+    if filename == '' or not allowed_file(filename):
+        return 'File type not allowed', 400
+    try:
+        size = int(fields['size']) if fields.get('size') is not None else None
+    except ValueError:
+        return 'size must be a number of bytes', 400
+    if size is not None and (size < 0 or size > MAX_UPLOAD_BYTES):
+        return 'Uploads are limited to ' + str(MAX_UPLOAD_BYTES) + ' bytes', 413
+    upload = chunkedUploads.create(filename, size)
+    return jsonify(dict(upload.status(), url=url_for('upload_chunk', uploadId=upload.id))), 201
+
+@app.route('/uploads/<uploadId>', methods = ['GET', 'PATCH'])
+def upload_chunk(uploadId):
+    ''' Append the request body to an upload at the offset of the Upload-Offset header (PATCH), or return where it ends (GET). '''
+    upload = chunkedUploads.get(uploadId)
+    if upload is None:
+        return 'Unknown upload', 404
+    if request.method == 'GET':
+        return jsonify(upload.status())
+    try:
+        offset = int(request.headers['Upload-Offset'])
+    except (KeyError, ValueError):
+        return 'Upload-Offset header with the offset of the chunk is required', 400
+    before = upload.received
+    try:
+        upload.append(request.stream, offset, MAX_UPLOAD_BYTES)
+    except uploads.OffsetMismatchError as e:
+        return jsonify(dict(upload.status(), error=str(e))), 409
+    except uploads.UploadFinishedError as e:
+        return str(e), 409
+    except uploads.UploadTooLargeError as e:
+        chunkedUploads.discard(upload)
+        return str(e), 413
+    finally:
+        uploadBytes.inc(upload.received - before)
+    return jsonify(upload.status())
+
+@app.route('/uploads/<uploadId>/complete', methods = ['POST'])
+@instrumentation.timed("upload")
+def complete_upload(uploadId):
+    ''' Queue a fully received chunked upload for analysis with the export profile of the profile field. Answers like /uploader. '''
+    upload = chunkedUploads.get(uploadId)
+    if upload is None:
+        return 'Unknown upload', 404
+    fields = request.get_json(silent=True) or request.form
+    profile = fields.get('profile', charter.fullProfile)
+    if profile not in charter.profiles:
+        return 'Unknown export profile', 400
+    if analysisQueue.isFull():
+        return 'Too many files are waiting to be processed, please try again later', 503
+    try:
+        chunkedUploads.complete(upload)
+    except uploads.IncompleteUploadError as e:
+        return jsonify(dict(upload.status(), error=str(e))), 409
+    except uploads.UploadFinishedError as e:
+        return str(e), 409
+    return queueAnalysis(upload, profile)
+
+def queueAnalysis(upload, profile):
+    '''
+    Queue the finished upload for analysis with the export profile, or answer from the result cache if it was analyzed before.
+
+    Takes over the upload's reference to its workspace. Returns the response of the upload routes.
+    '''
+    jobWorkspace = upload.workspace
+    cacheKey = resultCache.key(upload.contentHash(), upload.filename, profile)
+    cachedPath = resultCache.get(cacheKey)
+    instrumentation.annotate(file=upload.filename, bytes=upload.received, rows=upload.rows(), exportProfile=profile, cached=cachedPath is not None)
+    if cachedPath is not None:
+        # Same file analyzed before by the same version, answer with a job that is already done.
+        workspaces.discard(jobWorkspace)
+        job = analysisQueue.finished((cachedPath, None), "Finished, result from cache")
+        return jsonify(id=job.id, status=url_for('job_status', jobId=job.id), result=url_for('job_result', jobId=job.id), cached=True), 202
+
+    try:
+        job = analysisQueue.submit(analyzeUpload, jobWorkspace, upload.filename, cacheKey, profile, instrumentation.context(), upload.contentHash())
+    except jobs.QueueFullError:
+        workspaces.discard(jobWorkspace)
+        return 'Too many files are waiting to be processed, please try again later', 503
+    instrumentation.annotate(job=job.id)
+    return jsonify(id=job.id, status=url_for('job_status', jobId=job.id), result=url_for('job_result', jobId=job.id), cached=False), 202
+
+@app.route('/batch', methods = ['POST'])
+@instrumentation.timed("batchUpload")
+def upload_batch():
+    '''
+    Save every uploaded log file (all file fields, or one archive) and queue them for analysis together. Answers like /uploader.
+
+    Files with the same contents as an earlier file of the request are only analyzed once and listed in duplicates. The
+    result is one zip with the workbooks of every file and a summary workbook with a row for every batch of every file.
+    '''
+    files = [f for f in request.files.getlist('file') if f.filename != '']
+    if not files:
+        return 'No file uploaded', 400
+    if len(files) > MAX_BATCH_FILES:
+        return 'At most ' + str(MAX_BATCH_FILES) + ' files can be uploaded at once', 400
+    for f in files:
+        if not allowed_file(f.filename):
+            return 'File type not allowed: ' + f.filename, 400
+    profile = request.form.get('profile', charter.fullProfile)
+    if profile not in charter.profiles:
+        return 'Unknown export profile', 400
+    if analysisQueue.isFull():
+        return 'Too many files are waiting to be processed, please try again later', 503
+
+    # The reference to the workspace taken here is handed to the job, which releases it when it is done.
+    batchWorkspace = workspaces.create()
+    logs = {} # SHA-256 -> name of the file in the workspace, of every distinct file in upload order
+    duplicates = [] # Names of the files skipped because an earlier file had the same contents
+    try:
+        with instrumentation.span("receive", files=len(files)):
+            for f in files:
+                upload = uploads.Upload(batchWorkspace, uniqueFilename(secure_filename(f.filename), logs.values()))
+                upload.append(f.stream, 0, MAX_UPLOAD_BYTES)
+                uploadBytes.inc(upload.received)
+                if upload.contentHash() in logs:
+                    os.remove(upload.path)
+                    duplicates.append(f.filename)
+                else:
+                    logs[upload.contentHash()] = upload.filename
+    except uploads.UploadTooLargeError as e:
+        workspaces.discard(batchWorkspace)
+        return str(e), 413
+    except Exception as e:
+        print("Error saving uploaded files: " + repr(e))
+        workspaces.discard(batchWorkspace)
+        return "error saving file", 500
+
+    # The workbooks are named after the files, so the names are part of the key along with the contents
+    batchHash = hashlib.sha256("\n".join(contentHash + " " + filename for contentHash, filename in logs.items()).encode()).hexdigest()
+    cacheKey = resultCache.key(batchHash, "batch", profile)
+    cachedPath = resultCache.get(cacheKey)
+    instrumentation.annotate(files=len(logs), duplicates=len(duplicates), exportProfile=profile, cached=cachedPath is not None)
+    if cachedPath is not None:
+        workspaces.discard(batchWorkspace)
+        job = analysisQueue.finished((cachedPath, None), "Finished, result from cache")
+        return jsonify(id=job.id, status=url_for('job_status', jobId=job.id), result=url_for('job_result', jobId=job.id), cached=True,
+            files=list(logs.values()), duplicates=duplicates), 202
+
+    try:
+        job = analysisQueue.submit(analyzeBatch, batchWorkspace, logs, cacheKey, profile, instrumentation.context())
+    except jobs.QueueFullError:
+        workspaces.discard(batchWorkspace)
+        return 'Too many files are waiting to be processed, please try again later', 503
+    instrumentation.annotate(job=job.id)
+    return jsonify(id=job.id, status=url_for('job_status', jobId=job.id), result=url_for('job_result', jobId=job.id), cached=False,
+        files=list(logs.values()), duplicates=duplicates), 202
+
+def uniqueFilename(filename, taken):
+    ''' Return filename, or filename with a number added before its suffix if it is one of the names in taken. '''
+    stem = ingest.logName(filename)
+    suffix = filename[len(stem):]
+    number = 1
+    while filename in taken:
+        number += 1
+        filename = stem + "_" + str(number) + suffix
+    return filename
+
+@app.route('/jobs/<jobId>')
+def job_status(jobId):
+    ''' Return the state of an analysis job as JSON. '''
+    job = analysisQueue.get(jobId)
+    if job is None:
+        return 'Unknown job', 404
+    status = analysisQueue.status(job)
+    if job.state == jobs.doneState:
+        status["result"] = url_for('job_result', jobId=job.id)
+    return jsonify(status)
+
+@app.route('/jobs/<jobId>/result')
+def job_result(jobId):
+    ''' Send the results zip of a finished analysis job. '''
+    job = analysisQueue.get(jobId)
+    if job is None:
+        return 'Unknown job', 404
+    if job.state == jobs.failedState:
+        return job.error, 500
+    if job.state != jobs.doneState:
+        return 'Job is not finished yet', 409
+    path, workspaceId = job.result
+    resultWorkspace = workspaces.acquire(workspaceId) if workspaceId is not None else None
+    if workspaceId is not None and resultWorkspace is None:
+        return 'Result has expired, please upload the file again', 410
+    try:
+        # The open file stays readable even if the workspace or cache entry is removed while it is being sent.
+        resultFile = open(path, 'rb')
+    except FileNotFoundError:
+        return 'Result has expired, please upload the file again', 410
+    finally:
+        if resultWorkspace is not None:
+            workspaces.release(resultWorkspace)
+    return send_file(resultFile, as_attachment=True, download_name='result.zip')
+
+
+@app.route('/metrics')
+def metrics_endpoint():
+    ''' Return the metrics of the server in the Prometheus text exposition format. '''
+    return Response(registry.render(), content_type=metrics.contentType)
+
+
+@app.route('/cache/stats')
+def cache_stats():
+    ''' Return the hit/miss counters and size of the result cache as JSON. '''
+    return jsonify(resultCache.stats())
+
+
+def archiveName(zipf, name, folder):
+    ''' Return name, or name inside folder if the zip already has an entry called that, as logs with the same name in different folders of an archive would. '''
+    candidate = name
+    number = 1
+    while candidate in zipf.NameToInfo:
+        candidate = folder + ("_" + str(number) if number > 1 else "") + "/" + name
+        number += 1
+    return candidate
+
+
+def analyzeUpload(job, jobWorkspace, filename, cacheKey, profile=charter.fullProfile, spanContext=None, contentHash=None):
+    '''
+    Run the analysis on an uploaded file with the export profile, zip the workbooks and add the zip to the result cache under cacheKey.
+
+    Runs on a worker of analysisQueue and takes over the reference to jobWorkspace. Its spans are part of the trace of
+    spanContext, the upload request. contentHash is the SHA-256 computed while the file was received, so it isn't read
+    again to look it up in the parsed log store. Returns the path of the zip and the ID of the workspace it is in, or
+    None if it was moved to the result cache.
+    '''
+    with instrumentation.attached(spanContext), instrumentation.span("analyzeUpload", profile=True, job=job.id):
+        try:
+            filepath = os.path.join(jobWorkspace.uploadDir, filename)
+            path = os.path.join(jobWorkspace.downloadDir, 'results.zip')
+            # Workbooks are written in memory and added to the zip as soon as their sequence is done, without touching the disk.
+            with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as zipf:
+                def addWorkbook(result):
+                    if result.error is None:
+                        try:
+                            with instrumentation.span("zip", sequence=result.sequence, bytes=len(result.workbook)):
+                                zipf.writestr(archiveName(zipf, os.path.basename(result.outFileName), ingest.logName(filename)), result.workbook)
+                        except Exception as e:
+                            raise ArchiveError(repr(e))
+                    job.message = "Analyzed sequence " + result.sequence
+
+                try:
+                    job.message = "Analyzing log file"
+                    v = velLogScript.velLogScript()
+                    v.main(filepath, resultCallback=addWorkbook, inMemory=True, profile=profile, store=parsedLogs, contentHash=contentHash)
+                except ArchiveError as e:
+                    print(str(e))
+                    raise RuntimeError("error writing zip file with results")
+                except Exception as e:
+                    print(repr(e))
+                    raise RuntimeError("error running analysis script on supplied file")
+            os.remove(filepath)
+            instrumentation.annotate(zipBytes=os.path.getsize(path))
+            cachedPath = resultCache.put(cacheKey, path)
+            if cachedPath is None: # Bigger than the whole cache, serve it from the workspace.
+                return path, jobWorkspace.id
+            return cachedPath, None
+        finally:
+            workspaces.release(jobWorkspace)
+
+
+def analyzeBatch(job, batchWorkspace, logs, cacheKey, profile=charter.fullProfile, spanContext=None):
+    '''
+    Analyze the files of a multi-file upload in a pool of BATCH_WORKERS processes and zip their workbooks together with
+    a summary workbook of every batch of every file, then add the zip to the result cache under cacheKey.
+
+    logs maps the SHA-256 of every file to its name in the workspace, in upload order. Runs on a worker of analysisQueue
+    and takes over the reference to batchWorkspace. A file that fails doesn't stop the others and gets a row saying so
+    in the summary. Returns like analyzeUpload.
+    '''
+    filenames = list(logs.values())
+    with instrumentation.attached(spanContext), instrumentation.span("analyzeBatch", profile=True, job=job.id, files=len(filenames)):
+        try:
+            path = os.path.join(batchWorkspace.downloadDir, 'results.zip')
+            summaryPath = os.path.join(batchWorkspace.downloadDir, 'summary.xlsx')
+            rows = {} # File name -> summary rows, so the summary is in upload order whatever order the files finish in
+            failed = []
+            job.message = "Analyzing " + str(len(filenames)) + " log files"
+            with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as zipf:
+                with concurrent.futures.ProcessPoolExecutor(max_workers=min(BATCH_WORKERS, len(filenames)), mp_context=batchProcesses) as pool:
+                    # The workers share the parsed log store and its size limit, the server cleans it up when it starts
+                    futures = {pool.submit(batch.analyzeFile, os.path.join(batchWorkspace.uploadDir, filename), profile, False, PARSED_LOG_DIR,
+                        False, True, instrumentation.context(), contentHash, PARSED_LOG_MAX_BYTES, True) : filename for contentHash, filename in logs.items()}
+                    for done, future in enumerate(concurrent.futures.as_completed(futures), 1):
+                        filename = futures[future]
+                        try:
+                            results, records = future.result()
+                        except Exception as e:
+                            instrumentation.replay(getattr(e, "spanRecords", []))
+                            print("Analysis of " + filename + " failed: " + repr(e))
+                            failed.append(filename)
+                            rows[filename] = [[filename, "Failed: " + (str(e) or repr(e))]]
+                            continue
+                        instrumentation.replay(records) # The metrics of the sequences analyzed by the worker
+                        rows[filename] = batch.summaryRows(filename, results)
+                        for result in results:
+                            if result.error is not None:
+                                rows[filename].append([filename, result.sequence + " failed: " + result.error])
+                                continue
+                            with instrumentation.span("zip", sequence=result.sequence, bytes=len(result.workbook)):
+                                zipf.writestr(archiveName(zipf, os.path.basename(result.outFileName), ingest.logName(filename)), result.workbook)
+                        job.message = "Analyzed " + str(done) + " of " + str(len(filenames)) + " log files"
+                if len(failed) == len(filenames):
+                    raise RuntimeError("error running analysis script on every supplied file")
+                batch.writeSummary(summaryPath, [row for filename in filenames for row in rows[filename]])
+                zipf.write(summaryPath, 'summary.xlsx')
+            for filename in filenames:
+                os.remove(os.path.join(batchWorkspace.uploadDir, filename))
+            os.remove(summaryPath)
+            instrumentation.annotate(zipBytes=os.path.getsize(path), failedFiles=len(failed))
+            cachedPath = resultCache.put(cacheKey, path)
+            if cachedPath is None: # Bigger than the whole cache, serve it from the workspace.
+                return path, batchWorkspace.id
+            return cachedPath, None
+        finally:
+            workspaces.release(batchWorkspace)
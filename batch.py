@@ -0,0 +1,156 @@
+import argparse
+import concurrent.futures
+import contextlib
+import csv
+import glob
+import os
+import sys
+import time
+import constants
+import charter
+import ingest
+import instrumentation
+import logstore
+import velLogScript
+import xlsxwriter
+
+""" Batch analysis
+
+Analyzes many log files in one run instead of launching the script once per file. The inputs can be log files,
+folders (every log file in them, plain or compressed) or glob patterns. Files are analyzed in parallel by a pool of processes, one file per
+process at a time, and a line is printed as each one finishes. The summary of every batch of every sequence is also
+written to one combined table, a CSV file or an xlsx workbook depending on its extension, with a row per batch and a
+column per constants.SummaryKey.
+
+    python batch.py logs/2024-01-*.csv logs/dryer2 --summary week3.xlsx --jobs 8
+"""
+
+fileColumn = "Log file"
+sequenceColumn = "Sequence"
+
+
+def findLogFiles(inputs):
+    ''' Return the paths of the log files named by inputs (files, folders or glob patterns) in order, without duplicates. '''
+    paths = []
+    for name in inputs:
+        if os.path.isdir(name):
+            matches = sorted(path for suffix in ingest.logSuffixes for path in glob.glob(os.path.join(name, "*" + suffix)))
+        elif os.path.exists(name):
+            matches = [name]
+        else:
+            matches = sorted(glob.glob(name))
+            if not matches:
+                print("No log files found for " + name)
+        paths.extend(matches)
+    return list(dict.fromkeys(paths))
+
+
+def analyzeFile(path, profile, constantMemory, storeDirectory, verbose, inMemory=False, spanContext=None, contentHash=None, storeMaxBytes=None,
+        collectSpans=False):
+    '''
+    Analyze the log file at path in a worker process and return its list of velLogScript.SequenceResult.
+
+    With inMemory the workbooks are returned in the results instead of written next to the log. The spans of the
+    analysis are part of the trace of spanContext (see instrumentation.context). contentHash is the SHA-256 of the file
+    if it is already known, so it isn't read again to find it in the store, and storeMaxBytes the size limit of the store.
+    With collectSpans the records of the spans of the analysis are returned too, as (results, records), so the caller
+    can instrumentation.replay() them. If the analysis fails they are in the spanRecords attribute of the exception.
+    '''
+    store = logstore.LogStore(storeDirectory, storeMaxBytes, removePartial=False) if storeDirectory else None
+    with contextlib.ExitStack() as stack:
+        if not verbose: # The messages of several files at once are unreadable, only the progress lines are printed
+            stack.enter_context(contextlib.redirect_stdout(stack.enter_context(open(os.devnull, 'w'))))
+        stack.enter_context(instrumentation.attached(spanContext))
+        records = stack.enter_context(instrumentation.collected()) if collectSpans else None
+        try:
+            results = velLogScript.velLogScript().main(path, inMemory=inMemory, profile=profile, constantMemory=constantMemory, store=store,
+                contentHash=contentHash)
+        except Exception as exc:
+            if collectSpans:
+                exc.spanRecords = records
+            raise
+    # Errors are only reported as text, not every exception can be sent back from the worker process
+    results = [result._replace(error=repr(result.error)) if result.error is not None else result for result in results]
+    return (results, records) if collectSpans else results
+
+
+def summaryRows(path, results):
+    ''' Return a row of the combined summary for every batch of the successful sequences in results. '''
+    rows = []
+    for result in results:
+        for summary in result.summaries:
+            row = [path, result.sequence]
+            row.extend(summary.get(key.value, "") for key in constants.SummaryKey)
+            rows.append(row)
+    return rows
+
+
+def writeSummary(filename, rows):
+    ''' Write the combined summary rows with a header row to filename, as a workbook if it ends in .xlsx and as CSV otherwise. '''
+    headers = [fileColumn, sequenceColumn] + [key.value for key in constants.SummaryKey]
+    if filename.lower().endswith(".xlsx"):
+        workbook = xlsxwriter.Workbook(filename)
+        worksheet = workbook.add_worksheet("Summary")
+        worksheet.write_row(0, 0, headers)
+        for ind, row in enumerate(rows):
+            worksheet.write_row(ind + 1, 0, row)
+        worksheet.freeze_panes(1, 2)
+        workbook.close()
+    else:
+        with open(filename, 'w', newline='', encoding='utf-8-sig') as fp: # With a BOM so Excel reads the degree signs
+            writer = csv.writer(fp)
+            writer.writerow(headers)
+            writer.writerows(rows)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Analyze many VEL log files in parallel and write a combined summary of every batch.')
+    parser.add_argument('inputs', nargs='+', help='log files, folders of log files or glob patterns such as "logs/*.csv"')
+    parser.add_argument('--summary', default='summary.csv', help='combined summary to write, an .xlsx workbook or a CSV file (default summary.csv)')
+    parser.add_argument('--jobs', type=int, default=os.cpu_count(), help='number of files to analyze at the same time (default: number of cores)')
+    parser.add_argument('--profile', choices=charter.profiles, default=charter.fullProfile, help='export profile of the workbooks, see velLogScript.py')
+    parser.add_argument('--constant-memory', action='store_true', help='write workbooks row by row through temporary files to keep memory flat for long runs')
+    parser.add_argument('--store', metavar='DIR', default=None, help='folder to keep parsed log files in, so analyzing the same file again skips parsing it')
+    parser.add_argument('--verbose', action='store_true', help='print the messages of the analysis of every file')
+    args = parser.parse_args(argv)
+
+    paths = findLogFiles(args.inputs)
+    if not paths:
+        print("No log files to analyze")
+        return 1
+    if args.store:
+        logstore.LogStore(args.store) # Cleans up once here, the workers share the folder
+    print("Analyzing " + str(len(paths)) + " log files with " + str(args.jobs) + " processes")
+
+    start = time.perf_counter()
+    rows = {} # Path -> summary rows, so the combined summary is in input order whatever order the files finish in
+    failed = []
+    with concurrent.futures.ProcessPoolExecutor(max_workers=args.jobs) as pool:
+        futures = {pool.submit(analyzeFile, path, args.profile, args.constant_memory, args.store, args.verbose) : path for path in paths}
+        for done, future in enumerate(concurrent.futures.as_completed(futures), 1):
+            path = futures[future]
+            try:
+                results = future.result()
+            except Exception as exc:
+                failed.append(path)
+                print("[%d/%d] %s failed: %r" % (done, len(paths), path, exc))
+                continue
+            rows[path] = summaryRows(path, results)
+            errors = [result for result in results if result.error is not None]
+            if errors:
+                failed.append(path)
+            print("[%d/%d] %s: %d sequences, %d batches, %d failed (%.1f s elapsed)" % (done, len(paths), path,
+                len(results), len(rows[path]), len(errors), time.perf_counter() - start))
+            for result in errors:
+                print("    sequence " + result.sequence + ": " + result.error)
+
+    writeSummary(args.summary, [row for path in paths for row in rows.get(path, [])])
+    print("Wrote the summary of " + str(sum(len(fileRows) for fileRows in rows.values())) + " batches to " + args.summary)
+    if failed:
+        print(str(len(failed)) + " files had errors: " + ", ".join(failed))
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
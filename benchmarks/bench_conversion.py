@@ -0,0 +1,70 @@
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import converters
+
+""" Column conversion micro-benchmark
+
+Converts the columns of a synthetic log with the original per cell try/float() conversion and with
+converters.ColumnSchema and prints the time each takes.
+
+    python benchmarks/bench_conversion.py --rows 1000000
+"""
+
+
+def syntheticColumns(rows):
+    ''' Return a dictionary from column name to a list of strings shaped like the columns of a log file. '''
+    random.seed(0)
+    states = ["Stopped", "Wrk_runDeflectorDownSM", "Wrk_runEnclosureCheckSM", "Wrk_runDryingSM", "Wrk_UnlockDoor"]
+    columns = {}
+    columns["TimeStamp"] = ["2023-05-01 10:%02d:%02d.%03d" % (ind // 60000 % 60, ind // 1000 % 60, ind % 1000) for ind in range(rows)]
+    columns["Workflow"] = [states[ind * len(states) // rows] for ind in range(rows)]
+    columns["DigOut"] = [random.choice(["00000101000000000000", "00000000000000000000", "00000100000000000000"]) for ind in range(rows)]
+    columns["PT05"] = [str(round(random.uniform(-2, 30), 3)) for ind in range(rows)]
+    columns["TT04"] = [str(round(random.uniform(15, 80), 2)) if ind % 50 else "" for ind in range(rows)]
+    return columns
+
+
+def legacyConvert(values):
+    ''' The original conversion: try float() on every cell and keep the string if it fails. '''
+    result = []
+    for value in values:
+        try:
+            result.append(float(value))
+        except ValueError:
+            result.append(value)
+    return result
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    function(*args)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare per cell and schema driven column conversion.")
+    parser.add_argument("--rows", type=int, default=1000000, help="Number of rows of the synthetic log.")
+    args = parser.parse_args()
+
+    columns = syntheticColumns(args.rows)
+    schema = converters.ColumnSchema(list(columns))
+    totalLegacy = 0
+    totalSchema = 0
+    print("%-10s %12s %12s %8s" % ("column", "legacy (s)", "schema (s)", "speedup"))
+    for key, values in columns.items():
+        legacy = timed(legacyConvert, values)
+        converted = timed(schema.convert, key, values)
+        totalLegacy += legacy
+        totalSchema += converted
+        print("%-10s %12.3f %12.3f %7.1fx" % (key, legacy, converted, legacy / converted))
+    print("%-10s %12.3f %12.3f %7.1fx" % ("total", totalLegacy, totalSchema, totalLegacy / totalSchema))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+import argparse
+import io
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import charter
+import constants
+import runtable
+import numpy as np
+import xlsxwriter
+
+""" LogSheet writer benchmark
+
+Writes the LogSheet of a synthetic run with the original row by row loop (a list per row passed to write_row) and with
+charter.Charter.writeLogSheet and prints the time each takes. Both write to an in-memory workbook in constant_memory
+mode; the time to close (zip) the workbook is the same for both and isn't included.
+
+    python benchmarks/bench_logsheet.py --rows 500000
+"""
+
+sensorColumns = ["SCALE", "PT01", "PT02", "PT03", "PT05", "PT06", "PT07", "PT08", "PT09", "PT10", "FS01", "PeriPumpFlow",
+    "PT05_TREND", "PT08_9_TREND", "TT04", "TT05", "TT06", "TT07", "MFC01", "MFC02", "MFC01_P", "DPT01a", "DPT01b"]
+
+
+def syntheticTable(rows):
+    ''' Return a RunTable shaped like one long run of a log file. '''
+    rng = np.random.default_rng(0)
+    columns = {}
+    columns["id"] = np.arange(1, rows + 1, dtype=np.float64)
+    columns["SeqId"] = np.full(rows, 12.0)
+    columns["batch"] = runtable.EncodedColumn.fromValues(["B1"] * rows)
+    columns["TimeStamp"] = runtable.EncodedColumn.fromValues(["2024-01-18 %02d:%02d:%02d" % (ind // 36000 % 24, ind // 600 % 60, ind // 10 % 60) for ind in range(rows)])
+    columns["TimeSec"] = np.arange(rows) * 0.1
+    columns["Workflow"] = runtable.EncodedColumn.fromValues(["Wrk_runDryingSM"] * rows)
+    columns["SmDrying"] = runtable.EncodedColumn.fromValues(["Drying"] * rows)
+    columns["DigOut"] = runtable.EncodedColumn.fromValues(["00000101000000000000"] * rows)
+    columns["FaultCode"] = np.zeros(rows)
+    for key in sensorColumns:
+        values = np.round(rng.uniform(-2, 30, rows), 3)
+        values[rng.random(rows) < 0.01] = np.nan # Some blank cells
+        columns[key] = values
+    return runtable.RunTable(list(columns), columns)
+
+
+def legacyWrite(table, worksheet, start, end):
+    ''' The original LogSheet loop of Charter.createCharts. '''
+    elapsedTimes = []
+    firstTime = table.value(start, constants.Column.time.value)
+    secondsPerMinute = 60
+    for currentInd in range((end - start) + 1):
+        values = []
+        currentTime = table.value(start + currentInd, constants.Column.time.value)
+        elapsedTime = "Error"
+        if currentTime != "":
+            elapsedTime = ((currentTime - firstTime) / secondsPerMinute)
+            elapsedTimes.append(elapsedTime)
+        for key, value in zip(table.headers, table.rowValues(start + currentInd)):
+            values.append(value)
+            if key == constants.Column.time.value:
+                values.append(elapsedTime)
+        worksheet.write_row(currentInd + 1, 0, values)
+    return elapsedTimes
+
+
+def timedWrite(write):
+    workbook = xlsxwriter.Workbook(io.BytesIO(), {'constant_memory': True})
+    worksheet = workbook.add_worksheet(charter.Charter.logSheetName)
+    start = time.perf_counter()
+    write(worksheet)
+    elapsed = time.perf_counter() - start
+    workbook.close()
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the row by row and bulk LogSheet writers.")
+    parser.add_argument("--rows", type=int, default=500000, help="Number of rows of the synthetic run.")
+    args = parser.parse_args()
+
+    table = syntheticTable(args.rows)
+    end = len(table) - 1
+    chart = charter.Charter("benchmark.xlsx", 0, end, table, {})
+    legacy = timedWrite(lambda worksheet: legacyWrite(table, worksheet, 0, end))
+    bulk = timedWrite(chart.writeLogSheet)
+    cells = args.rows * (len(table.headers) + 1)
+    print("%-10s %10s %14s" % ("writer", "time (s)", "cells/s"))
+    print("%-10s %10.2f %14.0f" % ("legacy", legacy, cells / legacy))
+    print("%-10s %10.2f %14.0f" % ("bulk", bulk, cells / bulk))
+    print("speedup %.1fx" % (legacy / bulk))
+
+
+if __name__ == "__main__":
+    main()
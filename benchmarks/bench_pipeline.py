@@ -0,0 +1,214 @@
+import argparse
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import zipfile
+
+repoDir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, repoDir)
+
+import charter
+import ingest
+import resultcache
+import velLogScript
+import synthetic
+import numpy as np
+import xlsxwriter
+
+try:
+    import resource
+except ImportError: # Windows, peak RSS isn't recorded
+    resource = None
+
+""" Analysis pipeline benchmark
+
+Runs a log file through every stage of the analysis and times each stage on its own:
+    * read - reading the rows of the file (ingest.LogReader.fileRecords)
+    * sort - checking the id order and sorting out of order rows (ingest.sortRecords)
+    * convert - partitioning the rows by sequence and converting them to RunTables (ingest.partitionSequences)
+    * segment - indexing the state segments and finding the batches (prepareSequence and findBatches)
+    * statistics - calculating the summary values of every batch (summarizeBatch)
+    * xlsx - writing the workbook of every batch in memory (charter.Charter.createCharts)
+    * zip - adding the workbooks to a results zip like app.py does
+along with the wall time of the whole run and the peak RSS of the process. Every repeat runs in a fresh process, so the
+peak RSS of one doesn't hide the next. The log is generated by synthetic.py unless --log is given.
+
+Results are written as JSON with the commit they were measured on. Passing the results of an earlier commit with
+--compare prints the change of every stage and exits with status 1 if a stage got slower by more than --threshold:
+
+    python benchmarks/bench_pipeline.py --output before.json
+    git checkout my-branch
+    python benchmarks/bench_pipeline.py --compare before.json
+"""
+
+stages = ["read", "sort", "convert", "segment", "statistics", "xlsx", "zip"]
+noiseSeconds = 0.05 # Changes smaller than this are never reported as regressions
+
+
+class StageTimer:
+    ''' Adds up the time spent in each stage '''
+    def __init__(self):
+        self.seconds = dict.fromkeys(stages, 0.0)
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.seconds[name] += time.perf_counter() - start
+
+
+def peakRssBytes():
+    ''' Return the peak resident set size of this process in bytes, or None where it can't be read. '''
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024 # Bytes on macOS, kilobytes elsewhere
+
+
+def runPipeline(path, profile, constantMemory):
+    ''' Analyze the log file at path stage by stage and return the seconds of each stage, the wall time, the peak RSS and counts. '''
+    timer = StageTimer()
+    start = time.perf_counter()
+    batches = 0
+    with contextlib.redirect_stdout(io.StringIO()): # The progress messages of the analysis
+        with timer.stage("read"):
+            reader = ingest.LogReader(path)
+            records = list(reader.fileRecords())
+        rows = len(records)
+        with timer.stage("sort"):
+            ingest.sortRecords(records)
+        with timer.stage("convert"):
+            sequences = ingest.partitionSequences(reader, records)
+        analyzer = velLogScript.velLogScript()
+        archive = io.BytesIO()
+        with zipfile.ZipFile(archive, 'w', zipfile.ZIP_DEFLATED) as zipf:
+            for sequence, table in sequences:
+                with timer.stage("segment"):
+                    analyzer.prepareSequence(table)
+                    faultCodes = analyzer.findBatches()
+                for bat in range(len(analyzer.batchStarts)):
+                    with timer.stage("statistics"):
+                        summary = analyzer.summarizeBatch(bat, faultCodes[bat])
+                    with timer.stage("xlsx"):
+                        output = io.BytesIO()
+                        chartStart, chartEnd = analyzer.getExportInterval(bat, profile)
+                        charter.Charter(analyzer.getOutFileName(path, sequence), chartStart, chartEnd, table, summary, output,
+                            constantMemory, profile=profile).createCharts()
+                    with timer.stage("zip"):
+                        zipf.writestr(sequence + "_" + str(bat) + ".xlsx", output.getvalue())
+                    batches += 1
+    return {"stages": timer.seconds, "wall": time.perf_counter() - start, "peakRssBytes": peakRssBytes(),
+        "rows": rows, "sequences": len(sequences), "batches": batches, "zipBytes": len(archive.getvalue())}
+
+
+def gitState():
+    ''' Return (in order) the commit checked out in the repository and whether it has uncommitted changes, None for both outside of git. '''
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], cwd=repoDir, capture_output=True, text=True, check=True).stdout.strip()
+        status = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=repoDir, capture_output=True, text=True, check=True).stdout
+        return commit, bool(status.strip())
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+
+
+def summarize(runs):
+    ''' Combine repeated runs: the fastest time of each stage and of the wall time, and the highest peak RSS. '''
+    peaks = [run["peakRssBytes"] for run in runs if run["peakRssBytes"] is not None]
+    return {"stages": {name : min(run["stages"][name] for run in runs) for name in stages},
+        "wall": min(run["wall"] for run in runs), "peakRssBytes": max(peaks) if peaks else None}
+
+
+def compare(baseline, current, threshold):
+    ''' Print the change of every measurement from baseline to current and return the names of the ones that regressed. '''
+    if baseline["parameters"] != current["parameters"] or baseline["inputHash"] != current["inputHash"]:
+        print("Warning: the baseline was measured on a different input, the results aren't comparable")
+    regressions = []
+    print("\n%-12s %12s %12s %9s" % ("stage", "baseline", "current", "change"))
+    rows = [(name, baseline["result"]["stages"][name], current["result"]["stages"][name]) for name in stages]
+    rows.append(("wall", baseline["result"]["wall"], current["result"]["wall"]))
+    for name, before, after in rows:
+        change = (after - before) / before if before else 0.0
+        regressed = change > threshold and after - before > noiseSeconds
+        if regressed:
+            regressions.append(name)
+        print("%-12s %11.3fs %11.3fs %+8.1f%% %s" % (name, before, after, change * 100, "REGRESSION" if regressed else ""))
+    before, after = baseline["result"]["peakRssBytes"], current["result"]["peakRssBytes"]
+    if before and after:
+        change = (after - before) / before
+        if change > threshold:
+            regressions.append("peak RSS")
+        print("%-12s %10.1fMB %10.1fMB %+8.1f%% %s" % ("peak RSS", before / 2**20, after / 2**20, change * 100, "REGRESSION" if change > threshold else ""))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time every stage of the analysis of a log file.")
+    parser.add_argument("--log", default=None, help="log file to analyze instead of a synthetic one")
+    parser.add_argument("--sequences", type=int, default=3, help="number of sequences of the synthetic log")
+    parser.add_argument("--drying-minutes", type=float, default=60, help="length of the drying stage of each synthetic run")
+    parser.add_argument("--sample-seconds", type=float, default=0.5, help="time between the rows of the synthetic log")
+    parser.add_argument("--out-of-order", type=float, default=0.001, help="share of the rows of the synthetic log written out of id order")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the synthetic log")
+    parser.add_argument("--profile", choices=charter.profiles, default=charter.fullProfile, help="export profile of the workbooks")
+    parser.add_argument("--constant-memory", action="store_true", help="write the workbooks in constant_memory mode")
+    parser.add_argument("--repeat", type=int, default=3, help="number of runs, the fastest time of each stage is kept")
+    parser.add_argument("--output", default=None, help="file to write the results to as JSON")
+    parser.add_argument("--compare", default=None, help="results of an earlier run to compare with")
+    parser.add_argument("--threshold", type=float, default=0.2, help="slowdown of a stage reported as a regression (0.2 = 20%%)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as folder:
+        path = args.log
+        parameters = {"profile": args.profile, "constantMemory": args.constant_memory}
+        if path is None:
+            path = os.path.join(folder, "synthetic.csv")
+            synthetic.writeLog(path, args.sequences, args.drying_minutes, args.sample_seconds, args.out_of_order, args.seed)
+            parameters.update(sequences=args.sequences, dryingMinutes=args.drying_minutes, sampleSeconds=args.sample_seconds,
+                outOfOrder=args.out_of_order, seed=args.seed)
+        inputHash = resultcache.hashFile(path)
+        fileBytes = os.path.getsize(path)
+        runs = []
+        context = multiprocessing.get_context("spawn") # A fresh interpreter for every run
+        for repeat in range(args.repeat):
+            with context.Pool(1) as pool:
+                run = pool.apply(runPipeline, (path, args.profile, args.constant_memory))
+            runs.append(run)
+            print("run %d: %.2f s wall, %s" % (repeat + 1, run["wall"], ", ".join("%s %.2f" % (name, run["stages"][name]) for name in stages)))
+
+    commit, dirty = gitState()
+    current = {"commit": commit, "dirty": dirty, "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(), "numpy": np.__version__, "xlsxwriter": xlsxwriter.__version__,
+        "parameters": parameters, "inputHash": inputHash, "fileBytes": fileBytes,
+        "rows": runs[0]["rows"], "sequences": runs[0]["sequences"], "batches": runs[0]["batches"],
+        "result": summarize(runs), "runs": runs}
+    result = current["result"]
+    print("\n%d rows (%.1f MB), %d sequences, %d batches at commit %s%s" % (current["rows"], fileBytes / 2**20, current["sequences"],
+        current["batches"], commit, " (with uncommitted changes)" if dirty else ""))
+    for name in stages:
+        print("%-12s %8.3f s" % (name, result["stages"][name]))
+    print("%-12s %8.3f s" % ("wall", result["wall"]))
+    if result["peakRssBytes"] is not None:
+        print("%-12s %8.1f MB" % ("peak RSS", result["peakRssBytes"] / 2**20))
+    if args.output:
+        with open(args.output, 'w') as fp:
+            json.dump(current, fp, indent=2)
+    if args.compare:
+        with open(args.compare) as fp:
+            regressions = compare(json.load(fp), current, args.threshold)
+        if regressions:
+            print("\nRegressed: " + ", ".join(regressions))
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
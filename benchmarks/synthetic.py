@@ -0,0 +1,166 @@
+import argparse
+import csv
+import datetime
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import constants
+import segments
+import numpy as np
+
+""" Synthetic log generator
+
+Writes log files shaped like the ones the dryers record: the constants.Column headers (current names) plus an extra
+column the analysis doesn't know, a units row, and for each sequence the WorkSM states of a run in order with the
+DrySM states of the drying stage, PV05/PV07 bits in DigOut while the integrity checks run, occasional fault codes, a
+mostly blank text column and sensors that follow the stage they are in. The durations of the drying stage, the sampling
+interval, the number of sequences and the share of rows written out of id order are configurable, and the same seed
+always gives the same file.
+
+    python benchmarks/synthetic.py log.csv --sequences 3 --drying-minutes 60 --sample-seconds 0.5
+"""
+
+# WorkSM state, DrySM state, seconds, (PV05, PV07) of each stage of a run. The drying stage is given its length separately.
+runStages = [
+    (constants.WorkState.runDeflectorDown.value, "Idle", 60, (False, False)),
+    (constants.WorkState.runCassetteCheck.value, "Idle", 60, (True, False)),
+    (constants.WorkState.runEnclosureCheck.value, "Idle", 30, (False, False)),
+    (constants.WorkState.runAerosolCheck.value, "Idle", 45, (False, False)),
+    (constants.WorkState.runDispPrecheck.value, "Idle", 60, (True, True)),
+    (constants.WorkState.runDrying.value, constants.DryState.priming.value, 120, (False, False)),
+    (constants.WorkState.runDrying.value, constants.DryState.drying.value, None, (False, False)),
+    (constants.WorkState.runDrying.value, constants.DryState.dryingGasContinue.value, 120, (False, False)),
+    (constants.WorkState.runDispIntegrity.value, "Idle", 60, (True, True)),
+    (constants.WorkState.runDeflectorUp.value, "Idle", 60, (False, False)),
+    (constants.WorkState.unlockDoor.value, "Idle", 30, (False, False)),
+    (constants.WorkState.stopped.value, "Idle", 30, (False, False)),
+]
+oldNames = {constants.Column.workState_oldName, constants.Column.dryState_oldName, constants.Column.digatlOut_oldName}
+extraColumn = "Comment" # A column the analysis doesn't use, mostly blank
+digOutBits = 20
+runGapMinutes = 30 # Time between the runs of two sequences
+faultCodes = [3, 7, 12]
+faultRate = 0.002 # Share of rows with a nonzero fault code
+commentRate = 0.01 # Share of rows with a comment
+
+
+def headers():
+    ''' Return the columns of a generated log: id and SeqId, then every current constants.Column header, then extraColumn. '''
+    columns = [column.value for column in constants.Column if column not in oldNames and column != constants.Column.elapsedTime]
+    return ["id", "SeqId"] + columns + [extraColumn]
+
+
+def stateRows(dryingMinutes, sampleSeconds):
+    ''' Return (in order) the WorkSM state, DrySM state and (PV05, PV07) of every row of one run as lists. '''
+    work, dry, bits = [], [], []
+    for workState, dryState, seconds, pv in runStages:
+        rows = max(int(round((dryingMinutes * 60 if seconds is None else seconds) / sampleSeconds)), 1)
+        work.extend([workState] * rows)
+        dry.extend([dryState] * rows)
+        # The valves open a few rows into the check and close a few rows before it ends
+        edge = min(4, rows // 4)
+        bits.extend([pv if edge <= ind < rows - edge else (False, False) for ind in range(rows)])
+    return work, dry, bits
+
+
+def digOut(pv05, pv07):
+    bits = ["0"] * digOutBits
+    bits[segments.PV05Bit] = segments.bitSetString if pv05 else "0"
+    bits[segments.PV07Bit] = segments.bitSetString if pv07 else "0"
+    return "".join(bits) + "b"
+
+
+def sensorValues(rng, work, dry, rows):
+    ''' Return a dictionary from column name to a list of rows values following the stages in work and dry. '''
+    drying = np.array([state == constants.DryState.drying.value for state in dry])
+    inDrying = np.array([state == constants.WorkState.runDrying.value for state in work])
+    progress = np.cumsum(drying) / max(drying.sum(), 1) # 0 to 1 through the drying stage
+    noise = lambda scale : rng.normal(0, scale, rows)
+    values = {}
+    values[constants.Column.scale.value] = 500 - 6 * progress + noise(0.3)
+    for key, base in ((constants.Column.PT03.value, 1.2), (constants.Column.PT05.value, 2.5), (constants.Column.PT06.value, 0.8),
+            (constants.Column.PT07.value, 0.6), (constants.Column.PT08.value, -1.5), (constants.Column.PT09.value, -1.4),
+            (constants.Column.PT10.value, 1.1), (constants.Column.pt01Trend.value, 3.0), (constants.Column.pt02Trend.value, 2.0)):
+        values[key] = np.where(inDrying, base, base / 4) + noise(0.05)
+    values[constants.Column.FS01.value] = np.where(inDrying, 0.0, 1.5) + noise(0.1)
+    values[constants.Column.periPumpFlow.value] = np.where(drying, 0.7, 0.0) + noise(0.02)
+    values[constants.Column.pt05Trend.value] = noise(0.01)
+    values[constants.Column.pt08Trend.value] = noise(0.01)
+    for key, peak in ((constants.Column.TT04.value, 65), (constants.Column.TT05.value, 60), (constants.Column.TT06.value, 45),
+            (constants.Column.TT07.value, 44)):
+        values[key] = 22 + np.where(inDrying, peak - 22, 0) * np.minimum(progress * 10, 1) + noise(0.4)
+    for key, flow in ((constants.Column.MFC01.value, 30), (constants.Column.MFC02.value, 12), (constants.Column.MFC01_P.value, 2)):
+        values[key] = np.where(inDrying, flow, 0) + noise(0.2)
+    values[constants.Column.DPT01a.value] = np.where(inDrying, 0.4, 0) + noise(0.02)
+    values[constants.Column.DPT01b.value] = np.where(inDrying, 0.3, 0) + noise(0.02)
+    return {key : np.round(column, 3).tolist() for key, column in values.items()}
+
+
+def sequenceRows(rng, header, seqId, startTime, startSecond, dryingMinutes, sampleSeconds):
+    ''' Yield the rows of one sequence without ids, as lists of strings in header order. '''
+    work, dry, bits = stateRows(dryingMinutes, sampleSeconds)
+    rows = len(work)
+    sensors = sensorValues(rng, work, dry, rows)
+    faults = np.where(rng.random(rows) < faultRate, rng.choice(faultCodes, rows), 0).tolist()
+    comments = (rng.random(rows) < commentRate).tolist()
+    for ind in range(rows):
+        seconds = ind * sampleSeconds
+        values = {
+            "SeqId": str(seqId),
+            constants.Column.batch.value: "B" + str(seqId),
+            constants.Column.timeStamp.value: (startTime + datetime.timedelta(seconds=int(seconds))).strftime("%Y-%m-%d %H:%M:%S"),
+            constants.Column.time.value: "%.2f" % (startSecond + seconds),
+            constants.Column.workState.value: work[ind],
+            constants.Column.dryState.value: dry[ind],
+            constants.Column.digitalOut.value: digOut(*bits[ind]),
+            constants.Column.faultCode.value: str(faults[ind]),
+            extraColumn: "operator note" if comments[ind] else "",
+        }
+        yield [values[key] if key in values else repr(sensors[key][ind]) for key in header[1:]]
+
+
+def writeLog(path, sequences=3, dryingMinutes=60, sampleSeconds=0.5, outOfOrder=0.0, seed=0):
+    '''
+    Write a synthetic log file with sequences runs to path and return its number of rows.
+
+    Each run has a drying stage of dryingMinutes and a row every sampleSeconds. About outOfOrder of the rows are swapped
+    with a row a few places further down, as happens when rows are logged late.
+    '''
+    rng = np.random.default_rng(seed)
+    header = headers()
+    startTime = datetime.datetime(2024, 1, 18, 9, 0, 0)
+    startSecond = 0.0
+    rowId = 0
+    with open(path, 'w', newline='') as fp:
+        writer = csv.writer(fp)
+        writer.writerow(header)
+        writer.writerow(["units"] + [""] * (len(header) - 1))
+        for seqId in range(12, 12 + sequences):
+            rows = [[str(rowId + ind + 1)] + row for ind, row in enumerate(sequenceRows(rng, header, seqId, startTime, startSecond, dryingMinutes, sampleSeconds))]
+            for ind in np.flatnonzero(rng.random(len(rows)) < outOfOrder).tolist():
+                other = min(ind + 3, len(rows) - 1)
+                rows[ind], rows[other] = rows[other], rows[ind]
+            writer.writerows(rows)
+            rowId += len(rows)
+            startSecond += len(rows) * sampleSeconds
+            startTime += datetime.timedelta(seconds=len(rows) * sampleSeconds, minutes=runGapMinutes)
+    return rowId
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write a synthetic log file.")
+    parser.add_argument("path", help="log file to write")
+    parser.add_argument("--sequences", type=int, default=3, help="number of sequences (runs)")
+    parser.add_argument("--drying-minutes", type=float, default=60, help="length of the drying stage of each run")
+    parser.add_argument("--sample-seconds", type=float, default=0.5, help="time between rows")
+    parser.add_argument("--out-of-order", type=float, default=0.0, help="share of rows written out of id order")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    rows = writeLog(args.path, args.sequences, args.drying_minutes, args.sample_seconds, args.out_of_order, args.seed)
+    print("Wrote " + str(rows) + " rows to " + args.path)
+
+
+if __name__ == "__main__":
+    main()
@@ -3,27 +3,66 @@ import constants
 import xlsxwriter 
 import datetime 
 import math
+import os
+import re
+import downsample
+import instrumentation
+import numpy as np
+
+defaultChartPoints = 2000 # About the number of points a chart sheet can show across a screen
+
+# Export profiles, deciding what goes into a workbook besides the Summary sheet:
+fullProfile = "full" # LogSheet with every column and charts
+chartedProfile = "charted" # LogSheet with only the columns the charts use (see Charter.columnNums) and charts
+dryingProfile = "drying" # Like full, but the caller passes the drying window of the run as start and end
+summaryProfile = "summary" # Summary sheet only
+profiles = [fullProfile, chartedProfile, dryingProfile, summaryProfile]
+
+# Strings that xlsxwriter's worksheet.write() turns into formulas or links instead of writing them as text.
+specialStringPattern = re.compile(r"=|\{=.*\}\Z|(ftp|http)s?://|mailto:|(in|ex)ternal:|file://", re.DOTALL)
 
 class Charter:
     ''' Class to keep track of data values to track and then plot them when data is accumulated '''
     logSheetName = "LogSheet" # Filename of sheet containing log data for the run being charted.
     timeSheetName = "Elapsed Time" # Name of hidden time sheet that calculates elapsed time.
+    chartDataSheetName = "Chart Data" # Name of hidden sheet with the downsampled series the charts reference for long runs.
     filename = "" # Filename of workbook
     start = 0 # Start row index of entire log file for this run
     end = 0 # Last row index of entire log file for this run
     startRow = 1 # First row of logsheet to start reading for charts
     endRow = 0 # Last row of logsheet to read for creating charts
-    rows = [] # Rows of data for charts to reference
+    table = None # RunTable holding the data for charts to reference
     summaryInfo = {} # Set of summary information for this run
     columnNums = {}
-    def __init__(self, filename, start, end, rows, summaryInfo):
-        ''' Initialize an object for creating charts in the file with the specified filename based on rows starting at start and ending at end '''
+    output = None # Binary stream to write the workbook to instead of the file filename
+    constantMemory = False # Whether xlsxwriter flushes each row as it is written instead of keeping every sheet in memory
+    chartPoints = defaultChartPoints # Maximum number of points per chart series, None to chart every row
+    chartRanges = {} # LogSheet column number -> (x column, y column, last row) of its series on the chart data sheet
+    profile = fullProfile # Export profile, one of profiles
+    logSheetKeys = [] # Columns of table written to the LogSheet, in table order
+    def __init__(self, filename, start, end, table, summaryInfo, output=None, constantMemory=False, chartPoints=defaultChartPoints, profile=fullProfile):
+        '''
+        Initialize an object for creating charts in the file with the specified filename based on the rows of table starting at start and ending at end
+
+        If output is given (a writable binary stream such as io.BytesIO) the workbook is written to it and filename is only used in messages.
+        constantMemory turns on xlsxwriter's constant_memory mode, which keeps memory flat for long runs by writing rows out through temporary files.
+        Runs longer than chartPoints rows are charted from a hidden sheet with each series downsampled to about chartPoints points.
+        profile is one of profiles and decides which sheets and LogSheet columns are written.
+        '''
         print(f"initializing charter for {filename}")
         self.filename = filename
+        self.output = output
+        self.constantMemory = constantMemory
+        self.chartPoints = chartPoints
+        self.chartRanges = {}
+        if profile not in profiles:
+            raise ValueError("Unknown export profile " + str(profile) + ", expected one of " + ", ".join(profiles))
+        self.profile = profile
+        self.logSheetKeys = list(table.headers)
         self.start = start
         self.end = end
         self.endRow = end - start
-        self.rows = rows
+        self.table = table
         self.summaryInfo = summaryInfo
         self.columnNums = { # column number to use when referencing data for charts
                 #These values don't matter anymore, they get updated right after the log sheet is created in createCharts method to reflect the key - Henry Synnott
@@ -46,9 +85,10 @@ class Charter:
                 constants.Column.PT10 : 00
             }
         
+    @instrumentation.timed("createCharts")
     def createCharts(self):
         ''' Add the Full Run, Pressure, Plasma Delivery, and Perturbations charts to the given workbook '''
-        workbook = xlsxwriter.Workbook(self.filename)
+        workbook = xlsxwriter.Workbook(self.output if self.output is not None else self.filename, {'constant_memory': self.constantMemory})
         # TODO: Maybe separate worksheet and chartsheet creation
         # Summary sheet
         # Get the list of keys and round values
@@ -72,9 +112,19 @@ class Charter:
         summarySheet.write_row(0,0,keyList)
         summarySheet.write_row(1,0,summaryValues)
 
+        instrumentation.annotate(file=self.filename, rows=self.endRow + 1, exportProfile=self.profile)
+        if self.profile == summaryProfile:
+            print("Data added, saving to excel file. This might take a moment...")
+            self.closeWorkbook(workbook)
+            print("Data saved.")
+            return
+
         # Log sheet
+        if self.profile == chartedProfile:
+            chartedKeys = {key.value for key in self.columnNums}
+            self.logSheetKeys = [key for key in self.table.headers if key in chartedKeys]
         headers = []
-        for key in self.rows[0]:
+        for key in self.logSheetKeys:
             headers.append(key)
             if key == constants.Column.time.value: # Add elapsed time header to the right of timesec
                 headers.append(constants.Column.elapsedTime.value)
@@ -95,25 +145,8 @@ class Charter:
             self.columnNums.pop(key)
         
 
-        elapsedTimes = []
-        firstTime = self.rows[self.start][constants.Column.time.value]
-        secondsPerMinute = 60 # Number of seconds in a minute to get time elapsed as minutes.
-        for currentInd in range((self.end-self.start) + 1):
-            values = []
-            currentRow = self.rows[self.start + currentInd]
-            currentTime = (currentRow[constants.Column.time.value])
-            elapsedTime = "Error" # Placeholder in case there is an error calculating the elapsed time. TODO: Check how this affects charts
-            if currentTime != "":
-                try:
-                    elapsedTime = ((currentRow[constants.Column.time.value] - firstTime) / secondsPerMinute)
-                    elapsedTimes.append(elapsedTime)
-                except: print(currentTime)
-            for key in currentRow:
-                values.append(currentRow[key])
-                if key == constants.Column.time.value: # Add elapsed time to the right of timesec
-                    values.append(elapsedTime)
-
-            worksheet.write_row(currentInd+1,0,values)
+        with instrumentation.span("logSheet", columns=len(headers)):
+            elapsedTimes = self.writeLogSheet(worksheet)
 
         xLabel = "Elapsed Time (min)" # Label for the x-axis of the charts
         
@@ -173,37 +206,149 @@ class Charter:
                 except:
                     pass
 
-        #full run
-        self.addChartSheet(workbook, elapsedTimes, fullSheetName,fullChartTitle,leftLabelColumns,fullYLabel,xLabel,fullY2Label,fullRightColumns)
+        with instrumentation.span("chartSheets"):
+            self.writeChartData(workbook)
 
-        #pressure chart
-        self.addChartSheet(workbook, elapsedTimes, pressureSheetName,pressureChartTitle,pressureColumns,pressureYLabel,xLabel)
-        
-        #plasma chart
-        self.addChartSheet(workbook, elapsedTimes, plasmaSheetName,plasmaChartTitle,plasmaLeftColumns,plasmaYLabel,xLabel,plasmaY2Label,plasmaRightColumns)
+            #full run
+            self.addChartSheet(workbook, elapsedTimes, fullSheetName,fullChartTitle,leftLabelColumns,fullYLabel,xLabel,fullY2Label,fullRightColumns)
+
+            #pressure chart
+            self.addChartSheet(workbook, elapsedTimes, pressureSheetName,pressureChartTitle,pressureColumns,pressureYLabel,xLabel)
+            
+            #plasma chart
+            self.addChartSheet(workbook, elapsedTimes, plasmaSheetName,plasmaChartTitle,plasmaLeftColumns,plasmaYLabel,xLabel,plasmaY2Label,plasmaRightColumns)
 
-        #pertubation chart 
-        self.addChartSheet(workbook, elapsedTimes, perturbationsSheetName,perturbationsChartTitle,perturbationsLeftColumns,perturbationsYLabel,xLabel,perturbationsY2Label,perturbationsRightColumns)
+            #pertubation chart 
+            self.addChartSheet(workbook, elapsedTimes, perturbationsSheetName,perturbationsChartTitle,perturbationsLeftColumns,perturbationsYLabel,xLabel,perturbationsY2Label,perturbationsRightColumns)
 
         print("Data added, saving to excel file. This might take a moment...")
-        workbook.close()
+        self.closeWorkbook(workbook)
         print("Data saved.")
 
+    def closeWorkbook(self, workbook):
+        ''' Close (write out) workbook and record the size of the file in the span of createCharts. '''
+        with instrumentation.span("close"):
+            workbook.close()
+        if self.output is not None:
+            instrumentation.annotate(bytes=self.output.tell())
+        elif instrumentation.enabled():
+            instrumentation.annotate(bytes=os.path.getsize(self.filename))
+
+
+    def elapsedTimeColumn(self):
+        ''' Return the elapsed time in minutes since the first row of each row from start to end as a list of floats, with "Error" for rows whose time is blank or when the first time is. '''
+        times = self.table.numeric(constants.Column.time.value)[self.start:self.end + 1]
+        secondsPerMinute = 60 # Number of seconds in a minute to get time elapsed as minutes.
+        elapsed = (times - times[0]) / secondsPerMinute
+        values = np.array(elapsed, dtype=object)
+        values[np.isnan(elapsed)] = "Error" # Placeholder in case there is an error calculating the elapsed time. TODO: Check how this affects charts
+        return values.tolist()
+
+    def logSheetColumns(self, worksheet, elapsed):
+        '''
+        Return a list of (column number, values, write function) for every column of the LogSheet.
+
+        The write function is resolved once per column: write_number for numeric columns, write_string for text columns
+        unless one of their values would be written as a formula or link by worksheet.write, which is then used instead.
+        Values that would be written as an empty cell are None.
+        '''
+        columns = []
+        columnNum = 0
+        for key in self.logSheetKeys:
+            if self.table.isNumeric(key):
+                numbers = self.table.numeric(key)[self.start:self.end + 1]
+                values = numbers.astype(object)
+                values[np.isnan(numbers)] = None
+                columns.append((columnNum, values.tolist(), worksheet.write_number))
+            else:
+                column = self.table.text(key)
+                categories = [value if value != "" else None for value in column.categories]
+                isPlain = all(value is None or not specialStringPattern.match(value) for value in categories)
+                values = [categories[code] for code in column.codes[self.start:self.end + 1].tolist()]
+                columns.append((columnNum, values, worksheet.write_string if isPlain else worksheet.write))
+            columnNum += 1
+            if key == constants.Column.time.value: # Add elapsed time to the right of timesec
+                isNumbers = "Error" not in elapsed
+                columns.append((columnNum, elapsed, worksheet.write_number if isNumbers else worksheet.write))
+                columnNum += 1
+        return columns
+
+    def writeLogSheet(self, worksheet):
+        '''
+        Write the rows start to end of the table to worksheet below its header row and return the list of elapsed times that could be calculated.
+
+        Writes whole rows in order so it works in constant_memory mode, calling the write function of each column
+        directly instead of building a list per row for write_row to check the type of every cell.
+        '''
+        elapsed = self.elapsedTimeColumn()
+        columns = self.logSheetColumns(worksheet, elapsed)
+        for ind in range(self.end - self.start + 1):
+            row = ind + 1
+            for columnNum, values, write in columns:
+                value = values[ind]
+                if value is not None:
+                    write(row, columnNum, value)
+        return [value for value in elapsed if value != "Error"]
+
+    def writeChartData(self, workbook):
+        '''
+        Write the downsampled series of every charted numeric column to a hidden chart data sheet and record where they are in chartRanges.
+
+        Each series gets its own elapsed time and value columns holding the minimum and maximum of each of about chartPoints/2
+        buckets of rows, so peaks still show. Does nothing if the run has no more than chartPoints rows.
+        '''
+        self.chartRanges = {}
+        if self.chartPoints is None or self.endRow + 1 <= self.chartPoints:
+            return
+        times = self.table.numeric(constants.Column.time.value)[self.start:self.end + 1]
+        secondsPerMinute = 60
+        elapsed = (times - times[0]) / secondsPerMinute
+        headers = []
+        series = [] # (elapsed times, values) of each downsampled series, in chart data sheet column order
+        for key, columnNum in self.columnNums.items():
+            if key == constants.Column.time:
+                continue
+            if key == constants.Column.elapsedTime:
+                values = elapsed
+            elif self.table.isNumeric(key.value):
+                values = self.table.numeric(key.value)[self.start:self.end + 1]
+            else: # Text column, left pointing at the LogSheet
+                continue
+            indices = downsample.minMaxIndices(elapsed, values, self.chartPoints)
+            self.chartRanges[columnNum] = (2 * len(series), 2 * len(series) + 1, len(indices))
+            series.append((elapsed[indices].tolist(), values[indices].tolist()))
+            headers += [constants.Column.elapsedTime.value, key.value]
+        worksheet = workbook.add_worksheet(self.chartDataSheetName)
+        worksheet.hide()
+        worksheet.write_row(0, 0, headers)
+        # Row by row so it works in constant_memory mode
+        for ind in range(max((len(x) for x, y in series), default=0)):
+            for num, (x, y) in enumerate(series):
+                if ind < len(x):
+                    worksheet.write_number(ind + 1, 2 * num, x[ind])
+                    worksheet.write_number(ind + 1, 2 * num + 1, y[ind])
 
     def addSeries(self,chartSheet,columnNum,isRight):
         ''' Add a data line using the data in column columnNum to chartSheet that references the secondary y axis if isRight. '''
+        if columnNum in self.chartRanges: # Downsampled series on the chart data sheet
+            xColumn, yColumn, lastRow = self.chartRanges[columnNum]
+            values = [self.chartDataSheetName, 1, yColumn, lastRow, yColumn]
+            categories = [self.chartDataSheetName, 1, xColumn, lastRow, xColumn]
+        else:
+            values = [self.logSheetName, self.startRow, columnNum, self.endRow, columnNum]
+            categories = [self.logSheetName, 1,self.columnNums[constants.Column.elapsedTime] ,self.endRow,self.columnNums[constants.Column.elapsedTime]]
         if(isRight):
             chartSheet.add_series({
                 'name' : [self.logSheetName, 0, columnNum],
-                'values': [self.logSheetName, self.startRow, columnNum, self.endRow, columnNum],
-                'categories': [self.logSheetName, 1,self.columnNums[constants.Column.elapsedTime] ,self.endRow,self.columnNums[constants.Column.elapsedTime]],
+                'values': values,
+                'categories': categories,
                 'y2_axis' : 1,
             })
         else:
             chartSheet.add_series({
                 'name' : [self.logSheetName, 0, columnNum],
-                'values': [self.logSheetName, self.startRow, columnNum, self.endRow, columnNum],
-                'categories': [self.logSheetName, 1,self.columnNums[constants.Column.elapsedTime] ,self.endRow,self.columnNums[constants.Column.elapsedTime]],
+                'values': values,
+                'categories': categories,
             })
     def addChartSheet(self, book : xlsxwriter.Workbook, elapsedTimes, sheetName,chartTitle,leftColumns,ylabel,xlabel,y2label="", rightColumns=[]):
         ''' 
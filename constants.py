@@ -4,10 +4,10 @@ import enum
 class Column (enum.Enum):
     ''' Enum to hold string constants to refer to columns of the log file '''
     batch = "batch"
-    # workState = "WorkSM"
     workState =  "Workflow" 
-    # dryState = "DrySM" 
+    workState_oldName = "WorkSM" #past name from script, kept if script needs to be run on past data
     dryState = "SmDrying"
+    dryState_oldName = "DrySM" #past name from script, kept if script needs to be run on past data
     timeStamp = "TimeStamp"
     time = "TimeSec"
     elapsedTime = "Time (min)"
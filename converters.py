@@ -0,0 +1,90 @@
+import re
+import constants
+import runtable
+import numpy as np
+
+""" Schema driven column conversion
+
+Decides the type of every column once from the header of a log file and constants.Column, then converts whole
+columns of strings at a time instead of trying float() on every cell.
+
+Column types:
+    * text - the columns in runtable.textColumns (TimeStamp, Workflow/SmDrying, DigOut). Kept exactly as written.
+    * numeric - every other column of constants.Column. Blank cells become NaN. Malformed cells also become NaN and
+      are counted and reported, so a stray value can't turn a sensor column into text.
+    * auto - columns that aren't in constants.Column plus the batch column. Numeric if every non-blank cell is a number,
+      otherwise text. Converted chunks stay encoded text until decide() sees the whole column, so the type and the text
+      don't depend on how the rows were split into chunks.
+Exceptions are never raised per cell: a numeric column is converted in one call and only a column that actually contains
+a malformed cell falls back to checking its distinct values against numberPattern.
+"""
+
+numericType = "numeric"
+textType = "text"
+autoType = "auto"
+
+# Columns of constants.Column that can hold text, like batch IDs.
+autoColumns = {constants.Column.batch.value}
+
+# Strings accepted as numbers by the fallback check, the same forms float() accepts apart from digit separators.
+numberPattern = re.compile(r"\s*[+-]?((\d+\.?\d*|\.\d+)([eE][+-]?\d+)?|inf(inity)?|nan)\s*", re.IGNORECASE)
+
+
+def toFloats(values):
+    ''' Convert a list of strings to a float64 array in bulk, blanks become NaN. Raises ValueError if any cell isn't a number. '''
+    if "" in values:
+        values = [value or "nan" for value in values]
+    return np.fromiter(map(float, values), dtype=np.float64, count=len(values))
+
+
+def toFloatsMasked(values):
+    ''' Return (in order) a float64 array of values where blank and malformed cells are NaN and the number of malformed cells. '''
+    parsed = {} # Distinct value -> float
+    malformedValues = set()
+    for value in dict.fromkeys(values):
+        if value != "" and numberPattern.fullmatch(value):
+            parsed[value] = float(value)
+        else:
+            parsed[value] = np.nan
+            if value != "":
+                malformedValues.add(value)
+    result = np.fromiter(map(parsed.__getitem__, values), dtype=np.float64, count=len(values))
+    return result, sum(map(malformedValues.__contains__, values))
+
+
+class ColumnSchema:
+    ''' Column types of one log file, decided once from its header '''
+    def __init__(self, headers):
+        knownColumns = {column.value for column in constants.Column}
+        self.types = {} # Column name -> numericType, textType or autoType
+        for key in headers:
+            if key in runtable.textColumns:
+                self.types[key] = textType
+            elif key in knownColumns and key not in autoColumns:
+                self.types[key] = numericType
+            else:
+                self.types[key] = autoType
+        self.malformed = {} # Column name -> number of malformed cells converted to blanks so far
+
+    def convert(self, key, values):
+        ''' Convert the list of strings values of column key to a float64 array or an EncodedColumn according to the schema. '''
+        columnType = self.types.get(key, autoType)
+        if columnType in (textType, autoType):
+            return runtable.EncodedColumn.fromValues(values)
+        try:
+            return toFloats(values)
+        except ValueError:
+            pass
+        result, malformed = toFloatsMasked(values)
+        self.malformed[key] = self.malformed.get(key, 0) + malformed
+        print("Column " + key + " has " + str(malformed) + " values that aren't numbers, treating them as blank.")
+        return result
+
+    def decide(self, key, column):
+        ''' Return the whole converted column key, with an auto column turned into a float64 array if every value of it is a number. '''
+        if self.types.get(key, autoType) != autoType or not isinstance(column, runtable.EncodedColumn):
+            return column
+        try:
+            return toFloats(column.categories)[column.codes] if column.categories else np.empty(len(column), dtype=np.float64)
+        except ValueError:
+            return column
@@ -0,0 +1,26 @@
+import numpy as np
+
+""" Chart downsampling
+
+Reduces a series to the points a chart can actually show. The rows are split into equal buckets and the minimum and
+maximum of each bucket are kept (in row order), along with the first and last row, so every peak and dip of the full
+series still appears in the chart at a fraction of the points.
+"""
+
+
+def minMaxIndices(x, y, maxPoints):
+    '''
+    Return a sorted int array of the indices of x/y to plot so the series has at most about maxPoints points.
+
+    Rows where x or y is NaN are left out. If there are no more than maxPoints valid rows all of them are returned.
+    '''
+    valid = np.flatnonzero(~np.isnan(x) & ~np.isnan(y))
+    if len(valid) <= maxPoints:
+        return valid
+    buckets = max((maxPoints - 2) // 2, 1)
+    bucketOf = (np.arange(len(valid)) * buckets) // len(valid) # Bucket number of each valid row, ascending
+    order = np.lexsort((y[valid], bucketOf)) # By bucket, then by value
+    bucketStarts = np.flatnonzero(np.diff(bucketOf, prepend=-1))
+    bucketEnds = np.append(bucketStarts[1:], len(valid)) - 1
+    chosen = np.concatenate(([0], order[bucketStarts], order[bucketEnds], [len(valid) - 1]))
+    return valid[np.unique(chosen)]
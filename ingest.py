@@ -0,0 +1,312 @@
+import contextlib
+import csv
+import gzip
+import heapq
+import io
+import os
+import tempfile
+import zipfile
+import constants
+import converters
+import runtable
+import numpy as np
+
+try:
+    import zstandard
+except ImportError: # .csv.zst logs can't be read without it
+    zstandard = None
+
+""" Streaming log ingestion
+
+Reads a log file as a stream instead of loading every row into memory. The file is read twice:
+    * the first pass counts the complete rows of every sequence and finds the sequences that reached the drying stage
+    * the second pass routes the rows of those sequences into per sequence buffers that are converted to typed column
+      arrays a chunk at a time, and hands each sequence off as a RunTable as soon as its last row has been read.
+Rows are only sorted by id if an out of order row is found. In that case the file is sorted on disk in bounded
+runs that are merged back together while reading, so peak memory follows the largest sequence and not the whole file.
+
+loadSequences is the in-memory alternative: it reads the file once and partitions the rows by SeqId in the same pass.
+
+Logs can also be compressed as .csv.gz, .csv.zst (needs the zstandard package) or .zip with one or more CSV logs in it.
+They are decompressed as a stream while the rows are read, never expanded to disk, and each pass decompresses again.
+The logs in a zip are read one at a time by passing the name of the member returned by logMembers.
+"""
+
+chunkRows = 50000 # Number of rows of a sequence that are converted to typed column arrays at a time.
+sortRunRows = 200000 # Number of rows that are sorted in memory at a time when the file has to be sorted on disk.
+logSuffixes = [".csv", ".csv.gz", ".zip"] + ([".csv.zst"] if zstandard is not None else []) # Log files that can be read
+
+
+class OutOfOrderError(Exception):
+    ''' Raised while reading a log file whose rows aren't in ascending id order. '''
+
+
+def isLogFile(nameOfFile):
+    ''' Whether nameOfFile ends in one of logSuffixes. '''
+    return nameOfFile.lower().endswith(tuple(logSuffixes))
+
+
+def logName(nameOfFile, member=None):
+    ''' Return the name of the CSV log without its .csv suffix: the file name minus its compression suffix, or the member of a zip placed next to the zip. '''
+    if member is not None:
+        nameOfFile = os.path.join(os.path.dirname(nameOfFile), os.path.basename(member))
+    for suffix in (".csv.gz", ".csv.zst", ".zip", ".csv"):
+        if nameOfFile.lower().endswith(suffix):
+            return nameOfFile[:-len(suffix)]
+    return nameOfFile
+
+
+def logMembers(nameOfFile):
+    ''' Return the names of the CSV logs in the zip file nameOfFile in archive order, or [None] for a file that is a single log. '''
+    if not nameOfFile.lower().endswith(".zip"):
+        return [None]
+    with zipfile.ZipFile(nameOfFile) as archive:
+        members = [info.filename for info in archive.infolist() if not info.is_dir() and info.filename.lower().endswith(".csv")
+            and not os.path.basename(info.filename).startswith(".")] # Skips the resource forks macOS adds to zips
+    if not members:
+        raise ValueError(nameOfFile + " doesn't contain any .csv log files")
+    return members
+
+
+@contextlib.contextmanager
+def openLog(nameOfFile, member=None):
+    ''' Open the log file, or the member of a zip, as text for csv.reader, decompressing it while it is read. '''
+    lowerName = nameOfFile.lower()
+    with contextlib.ExitStack() as stack:
+        if member is not None:
+            binary = stack.enter_context(stack.enter_context(zipfile.ZipFile(nameOfFile)).open(member))
+        elif lowerName.endswith(".gz"):
+            binary = stack.enter_context(gzip.open(nameOfFile))
+        elif lowerName.endswith(".zst"):
+            if zstandard is None:
+                raise ValueError("Reading .csv.zst logs needs the zstandard package (pip install zstandard)")
+            binary = stack.enter_context(zstandard.ZstdDecompressor().stream_reader(stack.enter_context(open(nameOfFile, 'rb'))))
+        else:
+            yield stack.enter_context(open(nameOfFile, newline=''))
+            return
+        yield stack.enter_context(io.TextIOWrapper(binary, newline=''))
+
+
+def parseId(value):
+    ''' Return the id as a float or None if it isn't a number. '''
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def concatenateColumn(parts):
+    ''' Join the chunks of one column into a single float64 array or EncodedColumn. Every chunk of a column has the same type. '''
+    if all(isinstance(part, np.ndarray) for part in parts):
+        return np.concatenate(parts)
+    return runtable.EncodedColumn.concatenate(parts)
+
+
+class SequenceBuffer:
+    ''' Collects the rows of one sequence and converts them to typed columns every chunkRows rows. '''
+    def __init__(self, headers, schema):
+        self.headers = headers
+        self.schema = schema # converters.ColumnSchema deciding the type of each column
+        self.pending = [] # Rows that haven't been converted yet.
+        self.chunks = [] # Converted chunks, each a list of columns in header order.
+        self.count = 0 # Number of rows added.
+
+    def append(self, fields):
+        self.pending.append(fields)
+        self.count += 1
+        if len(self.pending) >= chunkRows:
+            self.convertPending()
+
+    def convertPending(self):
+        if self.pending:
+            columns = zip(*self.pending)
+            self.chunks.append([self.schema.convert(key, list(values)) for key, values in zip(self.headers, columns)])
+            self.pending = []
+
+    def toTable(self):
+        ''' Return a RunTable with every row that was added. '''
+        self.convertPending()
+        columns = {}
+        for ind, key in enumerate(self.headers):
+            columns[key] = self.schema.decide(key, concatenateColumn([chunk[ind] for chunk in self.chunks]))
+        self.chunks = []
+        return runtable.RunTable(self.headers, columns)
+
+
+class LogReader:
+    ''' Reads the rows with a numeric id from a log file, or the member of a zip file, in ascending id order. '''
+    def __init__(self, nameOfFile, member=None):
+        self.nameOfFile = nameOfFile
+        self.member = member # Name of the log in the zip file nameOfFile, None if the file is the log
+        self.runFiles = [] # Sorted runs written to disk if the file turned out to be out of order.
+        with openLog(nameOfFile, member) as csvfile:
+            self.headers = next(csv.reader(csvfile))
+        self.idIndex = self.headers.index("id")
+        self.schema = converters.ColumnSchema(self.headers)
+
+    def close(self):
+        ''' Delete the sorted runs, if any. '''
+        for runFile in self.runFiles:
+            os.remove(runFile)
+        self.runFiles = []
+
+    def fileRecords(self):
+        ''' Yield (in order) the id and fields of every row with a numeric id in file order. '''
+        with openLog(self.nameOfFile, self.member) as csvfile:
+            reader = csv.reader(csvfile)
+            next(reader)
+            for fields in reader:
+                rowId = parseId(fields[self.idIndex]) if len(fields) > self.idIndex else None
+                if rowId is not None:
+                    yield rowId, fields
+
+    def records(self):
+        ''' Yield the fields of every row with a numeric id in ascending id order. Raises OutOfOrderError if the file isn't sorted and hasn't been sorted on disk. '''
+        if self.runFiles:
+            yield from self.mergeRuns()
+            return
+        lastId = None
+        for rowId, fields in self.fileRecords():
+            if lastId is not None and rowId < lastId:
+                raise OutOfOrderError("id " + str(rowId) + " comes after id " + str(lastId))
+            lastId = rowId
+            yield fields
+
+    def sortOnDisk(self):
+        ''' Split the file into sorted runs of sortRunRows rows on disk so records can merge them in id order. '''
+        self.close()
+        run = []
+        for record in self.fileRecords():
+            run.append(record)
+            if len(run) >= sortRunRows:
+                self.writeRun(run)
+                run = []
+        if run:
+            self.writeRun(run)
+
+    def writeRun(self, run):
+        run.sort(key=lambda record : record[0])
+        handle, path = tempfile.mkstemp(suffix=".csv")
+        with os.fdopen(handle, 'w', newline='') as runFile:
+            csv.writer(runFile).writerows(fields for rowId, fields in run)
+        self.runFiles.append(path)
+
+    def readRun(self, path):
+        with open(path, newline='') as runFile:
+            for fields in csv.reader(runFile):
+                yield float(fields[self.idIndex]), fields
+
+    def mergeRuns(self):
+        # heapq.merge keeps rows with equal ids in file order, like sorting the whole file would
+        for rowId, fields in heapq.merge(*[self.readRun(path) for path in self.runFiles], key=lambda record : record[0]):
+            yield fields
+
+    def completeRows(self):
+        ''' Yield complete rows in id order. '''
+        return completeRows(self.records(), len(self.headers))
+
+
+def completeRows(records, numFields):
+    ''' Yield the complete rows of records. A row with missing fields is combined with the following rows until every field is provided. '''
+    currentRow = None # The row being compiled. May contain multiple rows of the csv if they get shifted.
+    for fields in records:
+        if currentRow is None:
+            currentRow = fields[:numFields] + [None] * (numFields - len(fields))
+        else:
+            for ind, value in enumerate(fields[:numFields]):
+                if value != "":
+                    currentRow[ind] = value
+        if None not in currentRow:
+            yield currentRow
+            currentRow = None
+
+
+def findWorkStateIndex(headers):
+    ''' Return the index of the WorkSM column in headers, checking its past name if needed. '''
+    if constants.Column.workState.value in headers:
+        return headers.index(constants.Column.workState.value)
+    return headers.index(constants.Column.workState_oldName.value)
+
+
+def scanSequences(reader):
+    '''
+    Return (in order) the number of complete rows of each sequence and the names of the sequences that reached the drying stage.
+
+    Sorts the file on disk first if an out of order row is found.
+    '''
+    seqIndex = reader.headers.index("SeqId")
+    workIndex = findWorkStateIndex(reader.headers)
+    while True:
+        counts = {} # Sequence id -> number of complete rows
+        names = {} # Sequence id -> name of the sequence as written in the file
+        try:
+            for fields in reader.completeRows():
+                seqId = parseId(fields[seqIndex])
+                counts[seqId] = counts.get(seqId, 0) + 1
+                if fields[workIndex] == constants.WorkState.runDrying.value and seqId not in names:
+                    names[seqId] = fields[seqIndex]
+            return counts, names
+        except OutOfOrderError as exc:
+            print("Log rows are out of order (" + str(exc) + "), sorting by id on disk.")
+            reader.sortOnDisk()
+
+
+def streamSequences(nameOfFile, member=None):
+    ''' Yield the name and RunTable of each sequence that reached the drying stage, reading the file (or its zip member) as a stream. '''
+    reader = LogReader(nameOfFile, member)
+    try:
+        counts, names = scanSequences(reader)
+        print("All succesful sequence ID's have been found as ", list(names.values()))
+        seqIndex = reader.headers.index("SeqId")
+        buffers = {} # Sequence id -> SequenceBuffer of the sequences that are still being read
+        for fields in reader.completeRows():
+            seqId = parseId(fields[seqIndex])
+            if seqId not in names:
+                continue
+            if seqId not in buffers:
+                buffers[seqId] = SequenceBuffer(reader.headers, reader.schema)
+            buffer = buffers[seqId]
+            buffer.append(fields)
+            if buffer.count == counts[seqId]:
+                del buffers[seqId]
+                yield names[seqId], buffer.toTable()
+    finally:
+        reader.close()
+
+
+def loadSequences(nameOfFile, member=None):
+    '''
+    Return a list of the name and RunTable of each sequence that reached the drying stage, reading the whole file (or its zip member) into memory.
+
+    Sequences are found and their rows partitioned in a single pass, so each sequence only touches its own rows.
+    '''
+    reader = LogReader(nameOfFile, member)
+    records = list(reader.fileRecords())
+    sortRecords(records)
+    return partitionSequences(reader, records)
+
+
+def sortRecords(records):
+    ''' Sort the (id, fields) records of a file by id in place if they are out of order. '''
+    ids = [rowId for rowId, fields in records]
+    if any(ids[ind] < ids[ind - 1] for ind in range(1, len(ids))):
+        #there was a problem where data was coming in and being added to the log sheet out of order, this sorts the data so the id column is in ascending sequential order
+        records.sort(key=lambda record : record[0])
+
+
+def partitionSequences(reader, records):
+    ''' Return a list of the name and RunTable of each sequence of the sorted records read by reader that reached the drying stage. Empties records. '''
+    seqIndex = reader.headers.index("SeqId")
+    workIndex = findWorkStateIndex(reader.headers)
+    buffers = {} # Sequence id -> SequenceBuffer with every row of the sequence
+    names = {} # Sequence id -> name of the sequence as written in the file, for sequences that reached the drying stage
+    for fields in completeRows((fields for rowId, fields in records), len(reader.headers)):
+        seqId = parseId(fields[seqIndex])
+        if seqId not in buffers:
+            buffers[seqId] = SequenceBuffer(reader.headers, reader.schema)
+        buffers[seqId].append(fields)
+        if fields[workIndex] == constants.WorkState.runDrying.value and seqId not in names:
+            names[seqId] = fields[seqIndex]
+    records.clear()
+    print("All succesful sequence ID's have been found as ", list(names.values()))
+    return [(names[seqId], buffers.pop(seqId).toTable()) for seqId in names]
@@ -0,0 +1,219 @@
+import contextlib
+import cProfile
+import functools
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+import uuid
+
+""" Instrumentation
+
+Timed spans around the stages of the analysis, written as JSON lines so they can be aggregated over many runs. Each
+line is one finished span:
+
+    {"name": "createCharts", "trace": "...", "span": "...", "parent": "...", "start": 1705568400.12, "seconds": 2.31,
+     "pid": 4242, "thread": "Analysis_0", "status": "ok", "rows": 1430, "bytes": 758846}
+
+Spans opened inside another span on the same thread are its children, and all spans of one upload or one run of the
+script share a trace ID, also across threads and processes when context() is handed over and attached(). Stages add
+counts such as rows and bytes to their span with annotate().
+
+Nothing is recorded until configure() is called or a listener is added, so spans cost next to nothing in normal runs.
+Listeners are called with the record of every finished span, whether or not it is written anywhere, which is how app.py
+turns spans into metrics. Worker processes don't share the listeners, so their spans are collected() and replayed in
+the process that has them. configure() can also turn on cProfile, which writes a .prof file for each outermost span
+marked with profile=True, and tracemalloc, which adds the change in traced memory to every span and the peak to those
+outermost profiled spans. Memory is traced for the whole process, so the numbers of spans running at the same time on
+different threads include each other's allocations.
+"""
+
+settings = None # Keyword arguments of configure(), None until it is called
+sink = None # Stream the JSON lines are written to
+listeners = [] # Functions called with the record of every finished span
+lock = threading.Lock() # Guards writes to sink
+local = threading.local() # stack: open spans of the thread, base: (trace, parent) attached from another thread or process
+
+
+class Span:
+    ''' One timed stage. fields are written with the span when it ends. '''
+    def __init__(self, name, trace, parent, fields):
+        self.name = name
+        self.id = uuid.uuid4().hex[:16]
+        self.trace = trace
+        self.parent = parent
+        self.fields = fields
+
+    def set(self, **fields):
+        self.fields.update(fields)
+
+
+class NullSpan:
+    ''' Stands in for a Span while instrumentation is off '''
+    def set(self, **fields):
+        pass
+
+
+nullSpan = NullSpan()
+
+
+def configure(logPath='-', profileDir=None, traceMemory=False):
+    '''
+    Start recording spans to the file logPath, appending, or to stderr if it is '-'.
+
+    If profileDir is given the outermost spans marked profile=True are profiled with cProfile into a .prof file there.
+    If traceMemory is true memory allocations are traced with tracemalloc.
+    '''
+    global settings, sink
+    sink = sys.stderr if logPath == '-' else open(logPath, 'a', buffering=1)
+    if profileDir is not None:
+        os.makedirs(profileDir, exist_ok=True)
+    if traceMemory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+    settings = {"logPath": logPath, "profileDir": profileDir, "traceMemory": traceMemory}
+
+
+def addListener(listener):
+    ''' Call listener with the record (a dictionary, see the module description) of every span that finishes from now on. '''
+    listeners.append(listener)
+
+
+@contextlib.contextmanager
+def collected():
+    ''' Yield a list the records of the spans that finish inside the block are appended to, to send them back from a worker process. '''
+    records = []
+    listeners.append(records.append)
+    try:
+        yield records
+    finally:
+        listeners.remove(records.append)
+
+
+def replay(records):
+    ''' Call the listeners with records of spans that finished in another process, as collected(). They aren't written again. '''
+    for record in records:
+        for listener in listeners:
+            listener(record)
+
+
+def enabled():
+    return settings is not None or bool(listeners)
+
+
+def openSpans():
+    if not hasattr(local, "stack"):
+        local.stack = []
+    return local.stack
+
+
+def context():
+    ''' Return what attached() needs to continue the current trace on another thread or process, None while instrumentation is off. '''
+    if not enabled():
+        return None
+    stack = openSpans()
+    trace, parent = (stack[-1].trace, stack[-1].id) if stack else getattr(local, "base", (None, None))
+    return {"settings": settings, "trace": trace, "parent": parent}
+
+
+@contextlib.contextmanager
+def attached(spanContext):
+    ''' Make the spans opened inside the block part of the trace spanContext (from context()) was taken in, configuring this process first if needed. '''
+    if spanContext is None:
+        yield
+        return
+    if settings is None and spanContext["settings"] is not None: # A worker process
+        configure(**spanContext["settings"])
+    previous = getattr(local, "base", (None, None))
+    local.base = (spanContext["trace"], spanContext["parent"])
+    try:
+        yield
+    finally:
+        local.base = previous
+
+
+@contextlib.contextmanager
+def span(name, profile=False, **fields):
+    '''
+    Time the block as the span name and yield the Span, whose fields can be extended with set(). fields are written with it.
+
+    With profile=True the block is profiled with cProfile and its memory peak is recorded if that was configured and
+    this is the outermost span of the thread.
+    '''
+    if not enabled():
+        yield nullSpan
+        return
+    stack = openSpans()
+    if stack:
+        trace, parent = stack[-1].trace, stack[-1].id
+    else:
+        trace, parent = getattr(local, "base", (None, None))
+    current = Span(name, trace or uuid.uuid4().hex, parent, fields)
+    outermost = profile and not stack
+    profiler = None
+    if outermost and settings is not None and settings["profileDir"] is not None:
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError: # Another profiler is running on this thread
+            profiler = None
+    tracing = tracemalloc.is_tracing()
+    if tracing:
+        if outermost:
+            tracemalloc.reset_peak()
+        memoryStart = tracemalloc.get_traced_memory()[0]
+    status, error = "ok", None
+    stack.append(current)
+    start = time.time()
+    counter = time.perf_counter()
+    try:
+        yield current
+    except BaseException as exc:
+        status, error = "error", repr(exc)
+        raise
+    finally:
+        seconds = time.perf_counter() - counter
+        stack.pop()
+        record = dict(current.fields)
+        if profiler is not None:
+            profiler.disable()
+            record["profile"] = os.path.join(settings["profileDir"], name + "-" + current.id + ".prof")
+            profiler.dump_stats(record["profile"])
+        if tracing:
+            memory, peak = tracemalloc.get_traced_memory()
+            record["memoryBytes"] = memory - memoryStart
+            if outermost:
+                record["memoryPeakBytes"] = peak - memoryStart
+        record.update(name=name, trace=current.trace, span=current.id, parent=current.parent, start=start, seconds=seconds,
+            pid=os.getpid(), thread=threading.current_thread().name, status=status)
+        if error is not None:
+            record["error"] = error
+        if sink is not None:
+            write(record)
+        for listener in listeners:
+            listener(record)
+
+
+def write(record):
+    line = json.dumps(record, default=str)
+    with lock:
+        sink.write(line + "\n")
+        sink.flush()
+
+
+def annotate(**fields):
+    ''' Add fields to the innermost open span of this thread, if any. '''
+    if enabled() and openSpans():
+        openSpans()[-1].fields.update(fields)
+
+
+def timed(name, profile=False):
+    ''' Decorator running the function in a span called name. '''
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with span(name, profile):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,120 @@
+import concurrent.futures
+import threading
+import time
+import uuid
+
+""" Background analysis jobs
+
+Runs uploaded log files through the analysis on a bounded pool of worker threads so a request only has to save the
+upload and hand it off. Each job gets an ID that the status and result routes of app.py look up. Jobs waiting for a
+worker are limited to maxQueued; past that submit raises QueueFullError so the server can turn uploads away instead
+of piling them up. Finished jobs are forgotten after retentionSeconds.
+"""
+
+queuedState = "queued"
+runningState = "running"
+doneState = "done"
+failedState = "failed"
+
+
+class QueueFullError(Exception):
+    ''' Raised when a job is submitted while the maximum number of jobs are already waiting for a worker. '''
+
+
+class Job:
+    ''' State of one submitted piece of work '''
+    def __init__(self):
+        self.id = uuid.uuid4().hex
+        self.state = queuedState
+        self.message = "Waiting for a free worker" # Human readable description of what the job is doing
+        self.result = None # Return value of the work once the job is done
+        self.error = None # Message of the exception the work failed with
+        self.created = time.time()
+        self.finished = None # Time the job finished or failed, None until then
+
+    def isFinished(self):
+        return self.state in (doneState, failedState)
+
+
+class JobQueue:
+    ''' Bounded pool of worker threads running jobs in submission order '''
+    def __init__(self, workers, maxQueued, retentionSeconds=3600):
+        self.maxQueued = maxQueued # Maximum number of jobs waiting for a worker
+        self.retentionSeconds = retentionSeconds # Seconds a finished job can still be looked up
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=workers, thread_name_prefix="Analysis")
+        self.lock = threading.Lock()
+        self.jobs = {} # Job ID -> Job
+        self.waiting = [] # IDs of the queued jobs in submission order
+
+    def submit(self, work, *args):
+        '''
+        Queue work(job, *args) and return its Job right away. The return value of work becomes job.result.
+
+        Raises QueueFullError if maxQueued jobs are already waiting.
+        '''
+        job = Job()
+        with self.lock:
+            self.prune()
+            if len(self.waiting) >= self.maxQueued:
+                raise QueueFullError(str(len(self.waiting)) + " jobs are already waiting")
+            self.jobs[job.id] = job
+            self.waiting.append(job.id)
+        self.executor.submit(self.run, job, work, args)
+        return job
+
+    def finished(self, result, message="Finished"):
+        ''' Return a new Job that is already done with result, for work that didn't have to be queued. '''
+        job = Job()
+        job.result = result
+        job.state = doneState
+        job.message = message
+        job.finished = time.time()
+        with self.lock:
+            self.prune()
+            self.jobs[job.id] = job
+        return job
+
+    def counts(self):
+        ''' Return the number of jobs in each state that are still remembered, as a dictionary from state to count. '''
+        with self.lock:
+            counts = dict.fromkeys((queuedState, runningState, doneState, failedState), 0)
+            for job in self.jobs.values():
+                counts[job.state] += 1
+            return counts
+
+    def isFull(self):
+        with self.lock:
+            return len(self.waiting) >= self.maxQueued
+
+    def run(self, job, work, args):
+        with self.lock:
+            self.waiting.remove(job.id)
+            job.state = runningState
+            job.message = "Processing"
+        try:
+            job.result = work(job, *args)
+            job.state = doneState
+            job.message = "Finished"
+        except Exception as e:
+            print("Job " + job.id + " failed: " + repr(e))
+            job.error = str(e) or repr(e)
+            job.state = failedState
+            job.message = "Failed"
+        job.finished = time.time()
+
+    def get(self, jobId):
+        ''' Return the Job with the ID jobId or None if there is no such job or it has been forgotten. '''
+        with self.lock:
+            return self.jobs.get(jobId)
+
+    def status(self, job):
+        ''' Return a dictionary describing job for the status route. position is the place in the queue of a waiting job, 0 once it runs. '''
+        with self.lock:
+            position = self.waiting.index(job.id) + 1 if job.id in self.waiting else 0
+        return {"id": job.id, "state": job.state, "message": job.message, "position": position, "error": job.error}
+
+    def prune(self):
+        ''' Forget jobs that finished more than retentionSeconds ago. Expects the lock to be held. '''
+        cutoff = time.time() - self.retentionSeconds
+        for jobId in [jobId for jobId, job in self.jobs.items() if job.finished is not None and job.finished < cutoff]:
+            del self.jobs[jobId]
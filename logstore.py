@@ -0,0 +1,133 @@
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import runtable
+import numpy as np
+
+""" Parsed log store
+
+Keeps the parsed sequences of every log file that has been analyzed, so analyzing the same file again (new summary
+keys, another export profile) skips reading and converting the CSV. Entries are keyed by the SHA-256 of the log file.
+Each entry is a folder with one .npy file per column of every sequence and a manifest.json listing the sequences, their
+headers and the categories of their text columns. Columns are loaded memory-mapped, so loading an entry only reads the
+manifest and the rows the analysis actually touches are paged in from disk.
+
+An entry is written to a temporary folder while its sequences are parsed and only renamed into place once the last one
+is saved, so a parse that fails part way never leaves a partial entry behind.
+"""
+
+storeVersion = 2 # Version of the entry layout and of the parsing behind it. Entries of other versions are parsed again.
+manifestName = "manifest.json"
+partialPrefix = "partial-" # Prefix of the folders of entries that are still being written
+
+
+class LogStore:
+    ''' Folder of parsed log files keyed by content hash, optionally bounded in size by evicting the least recently used entries '''
+    def __init__(self, directory, maxBytes=None, removePartial=True):
+        ''' removePartial deletes entries left half written by a killed parse. Pass False when other processes may be writing to directory. '''
+        self.directory = directory
+        self.maxBytes = maxBytes # Maximum total size of the entries, None for no limit
+        self.lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        if removePartial:
+            for name in os.listdir(directory):
+                if name.startswith(partialPrefix):
+                    shutil.rmtree(os.path.join(directory, name), ignore_errors=True)
+
+    def path(self, contentHash):
+        return os.path.join(self.directory, contentHash)
+
+    def load(self, contentHash):
+        ''' Return a list of the name and RunTable of each stored sequence of the log file with the SHA-256 contentHash, or None if it isn't stored. '''
+        folder = self.path(contentHash)
+        try:
+            with open(os.path.join(folder, manifestName)) as fp:
+                manifest = json.load(fp)
+        except (OSError, ValueError):
+            return None
+        if manifest.get("version") != storeVersion:
+            return None
+        try:
+            os.utime(os.path.join(folder, manifestName)) # Marks the entry as recently used for eviction
+        except OSError:
+            pass
+        try:
+            return [(sequence["name"], self.loadTable(folder, sequence)) for sequence in manifest["sequences"]]
+        except OSError: # Evicted or replaced while loading
+            return None
+
+    def loadTable(self, folder, sequence):
+        columns = {}
+        for key, column in zip(sequence["headers"], sequence["columns"]):
+            # numpy can't memory-map an empty file, empty columns are read normally
+            values = np.load(os.path.join(folder, column["file"]), mmap_mode='r' if sequence["rows"] else None)
+            if "categories" in column:
+                values = runtable.EncodedColumn(values, column["categories"])
+            columns[key] = values
+        return runtable.RunTable(sequence["headers"], columns)
+
+    def save(self, contentHash, sequences):
+        '''
+        Yield each (name, RunTable) of sequences after saving it under contentHash.
+
+        The entry is stored once sequences is exhausted. If the caller stops early or parsing fails nothing is stored.
+        '''
+        folder = tempfile.mkdtemp(prefix=partialPrefix, dir=self.directory)
+        stored = False
+        try:
+            manifest = {"version": storeVersion, "created": time.time(), "sequences": []}
+            for name, table in sequences:
+                manifest["sequences"].append(self.saveTable(folder, len(manifest["sequences"]), name, table))
+                yield name, table
+            with open(os.path.join(folder, manifestName), 'w') as fp:
+                json.dump(manifest, fp)
+            with self.lock:
+                shutil.rmtree(self.path(contentHash), ignore_errors=True) # An entry of another version
+                try:
+                    os.replace(folder, self.path(contentHash))
+                except OSError: # Another process stored the same file first, its entry is just as good
+                    return
+                stored = True
+                self.evict()
+        finally:
+            if not stored:
+                shutil.rmtree(folder, ignore_errors=True)
+
+    def saveTable(self, folder, sequenceNum, name, table):
+        ''' Write the columns of table to folder and return its manifest entry. '''
+        columns = []
+        for columnNum, key in enumerate(table.headers):
+            column = {"file": str(sequenceNum) + "_" + str(columnNum) + ".npy"}
+            values = table.columns[key]
+            if isinstance(values, runtable.EncodedColumn):
+                column["categories"] = values.categories
+                values = values.codes
+            np.save(os.path.join(folder, column["file"]), values)
+            columns.append(column)
+        return {"name": name, "rows": len(table), "headers": table.headers, "columns": columns}
+
+    def entrySize(self, contentHash):
+        folder = self.path(contentHash)
+        return sum(os.path.getsize(os.path.join(folder, name)) for name in os.listdir(folder))
+
+    def evict(self):
+        ''' Remove least recently used entries until the store fits in maxBytes. Expects the lock to be held. '''
+        if self.maxBytes is None:
+            return
+        entries = []
+        for name in os.listdir(self.directory):
+            manifest = os.path.join(self.directory, name, manifestName)
+            if not name.startswith(partialPrefix) and os.path.exists(manifest):
+                entries.append((os.path.getmtime(manifest), name, self.entrySize(name)))
+        entries.sort()
+        total = sum(size for _, _, size in entries)
+        for _, name, size in entries[:-1]: # The newest entry is kept even if it is bigger than maxBytes on its own
+            if total <= self.maxBytes:
+                break
+            # Memory-mapped columns of a removed entry stay readable on POSIX. On Windows removing them fails while
+            # they are open and the entry is tried again by the next eviction.
+            shutil.rmtree(self.path(name), ignore_errors=True)
+            total -= size
@@ -0,0 +1,155 @@
+import bisect
+import math
+import threading
+
+""" Metrics
+
+Counters, gauges and histograms with labels, rendered in the Prometheus text exposition format (version 0.0.4) so any
+Prometheus compatible scraper can read them from the /metrics route of app.py. Values that already live somewhere else,
+such as the counters of the result cache or the length of the job queue, are read when the metrics are rendered with
+Callback instead of being copied on every change.
+"""
+
+contentType = "text/plain; version=0.0.4; charset=utf-8"
+defaultBuckets = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300) # Seconds
+
+
+def formatValue(value):
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if math.isnan(value):
+        return "NaN"
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def escapeLabel(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def formatLabels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(name + '="' + escapeLabel(value) + '"' for name, value in labels) + "}"
+
+
+class Metric:
+    ''' Base of the metric types: a name, help text and the names of its labels '''
+    type = "untyped"
+
+    def __init__(self, name, description, labelNames=()):
+        self.name = name
+        self.description = description
+        self.labelNames = tuple(labelNames)
+        self.lock = threading.Lock()
+        self.values = {} # Tuple of label values -> value
+
+    def key(self, labels):
+        if set(labels) != set(self.labelNames):
+            raise ValueError(self.name + " takes the labels " + ", ".join(self.labelNames) + ", not " + ", ".join(labels))
+        return tuple(str(labels[name]) for name in self.labelNames)
+
+    def samples(self):
+        ''' Return a list of (name suffix, list of (label, value), value) of every sample. '''
+        with self.lock:
+            return [("", list(zip(self.labelNames, key)), value) for key, value in sorted(self.values.items())]
+
+    def render(self):
+        lines = ["# HELP " + self.name + " " + self.description.replace("\\", "\\\\").replace("\n", "\\n"), "# TYPE " + self.name + " " + self.type]
+        for suffix, labels, value in self.samples():
+            lines.append(self.name + suffix + formatLabels(labels) + " " + formatValue(value))
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    ''' Value that only goes up, such as the number of requests '''
+    type = "counter"
+
+    def inc(self, amount=1, **labels):
+        if amount < 0:
+            raise ValueError("Counters can't decrease")
+        key = self.key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    ''' Value that goes up and down, such as the number of running jobs '''
+    type = "gauge"
+
+    def set(self, value, **labels):
+        key = self.key(labels)
+        with self.lock:
+            self.values[key] = value
+
+    def inc(self, amount=1, **labels):
+        key = self.key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(Metric):
+    ''' Distribution of observed values, such as request durations, counted in cumulative buckets '''
+    type = "histogram"
+
+    def __init__(self, name, description, labelNames=(), buckets=defaultBuckets):
+        super().__init__(name, description, labelNames)
+        self.buckets = sorted(buckets) # Upper bounds, +Inf is added when rendering
+
+    def observe(self, value, **labels):
+        key = self.key(labels)
+        with self.lock:
+            counts, total = self.values.get(key, ([0] * (len(self.buckets) + 1), 0.0))
+            counts[bisect.bisect_left(self.buckets, value)] += 1 # Bucket bounds are inclusive
+            self.values[key] = (counts, total + value)
+
+    def samples(self):
+        samples = []
+        with self.lock:
+            values = sorted((key, (list(counts), total)) for key, (counts, total) in self.values.items())
+        for key, (counts, total) in values:
+            labels = list(zip(self.labelNames, key))
+            cumulative = 0
+            for bound, count in zip(self.buckets + [math.inf], counts):
+                cumulative += count
+                samples.append(("_bucket", labels + [("le", formatValue(bound))], cumulative))
+            samples.append(("_sum", labels, total))
+            samples.append(("_count", labels, cumulative))
+        return samples
+
+
+class Callback(Metric):
+    '''
+    Metric whose samples are read from function when rendered.
+
+    function returns a number, or a dictionary from a tuple of label values (in the order of labelNames) to a number.
+    '''
+    def __init__(self, name, description, type, function, labelNames=()):
+        super().__init__(name, description, labelNames)
+        self.type = type
+        self.function = function
+
+    def samples(self):
+        value = self.function()
+        if not isinstance(value, dict):
+            value = {(): value}
+        return [("", list(zip(self.labelNames, key)), number) for key, number in sorted(value.items())]
+
+
+class Registry:
+    ''' Set of metrics rendered together '''
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        ''' Add metric and return it. '''
+        if any(existing.name == metric.name for existing in self.metrics):
+            raise ValueError("A metric called " + metric.name + " is already registered")
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        ''' Return every metric in the text exposition format. '''
+        return "".join(metric.render() + "\n" for metric in self.metrics)
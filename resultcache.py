@@ -0,0 +1,104 @@
+import collections
+import hashlib
+import os
+import shutil
+import threading
+
+""" Analysis result cache
+
+Keeps the results zip of every analyzed upload on disk, keyed by the SHA-256 of the uploaded file, its name (the
+workbooks in the zip are named after it), the export profile and the analyzer version, so a file that has been analyzed before is served
+without parsing it again. The total size of the cache is bounded, evicting the least recently used results first.
+"""
+
+hashChunkBytes = 1024 * 1024 # Number of bytes read at a time while hashing a file
+resultSuffix = ".zip"
+
+
+def hashFile(path):
+    ''' Return the hex SHA-256 of the contents of the file at path. '''
+    digest = hashlib.sha256()
+    with open(path, 'rb') as fp:
+        for chunk in iter(lambda: fp.read(hashChunkBytes), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ResultCache:
+    ''' Size bounded least recently used cache of result files in a directory '''
+    def __init__(self, directory, maxBytes, version):
+        self.directory = directory
+        self.maxBytes = maxBytes # Maximum total size of the cached results
+        self.version = version # Analyzer version, part of every key so results of older versions are never served
+        self.lock = threading.Lock()
+        self.entries = collections.OrderedDict() # Key -> size in bytes, least recently used first
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        os.makedirs(directory, exist_ok=True)
+        found = []
+        for name in os.listdir(directory):
+            if name.endswith(resultSuffix):
+                stat = os.stat(os.path.join(directory, name))
+                found.append((stat.st_mtime, name[:-len(resultSuffix)], stat.st_size))
+        for mtime, key, size in sorted(found):
+            self.entries[key] = size
+        with self.lock:
+            self.evict()
+
+    def key(self, contentHash, filename, profile):
+        ''' Return the cache key for an upload with the SHA-256 contentHash saved as filename and exported with profile. '''
+        return hashlib.sha256("\n".join((self.version, contentHash, filename, profile)).encode()).hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, key + resultSuffix)
+
+    def totalBytes(self):
+        return sum(self.entries.values())
+
+    def get(self, key):
+        ''' Return the path of the cached result for key and mark it as recently used, or None on a miss. '''
+        with self.lock:
+            path = self.path(key)
+            if key in self.entries and os.path.exists(path):
+                self.entries.move_to_end(key)
+                self.hits += 1
+                try:
+                    os.utime(path) # Keeps the order when the cache is reloaded
+                except OSError:
+                    pass
+                return path
+            self.entries.pop(key, None)
+            self.misses += 1
+            return None
+
+    def put(self, key, sourcePath):
+        ''' Move the result file sourcePath into the cache under key and return its new path. Returns None and leaves sourcePath alone if it is bigger than the whole cache. '''
+        size = os.path.getsize(sourcePath)
+        if size > self.maxBytes:
+            return None
+        with self.lock:
+            path = self.path(key)
+            shutil.move(sourcePath, path)
+            self.entries.pop(key, None)
+            self.entries[key] = size
+            self.evict()
+            return path
+
+    def evict(self):
+        ''' Remove least recently used results until the cache fits in maxBytes. Expects the lock to be held. '''
+        total = self.totalBytes()
+        while total > self.maxBytes and self.entries:
+            key, size = self.entries.popitem(last=False)
+            total -= size
+            self.evictions += 1
+            try:
+                os.remove(self.path(key))
+            except OSError: # Still being sent on Windows, it is dropped from the index either way.
+                print("Could not remove cached result " + key)
+
+    def stats(self):
+        ''' Return a dictionary of the hit, miss and eviction counters and the size of the cache. '''
+        with self.lock:
+            return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+                "entries": len(self.entries), "bytes": self.totalBytes(), "maxBytes": self.maxBytes}
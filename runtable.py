@@ -0,0 +1,131 @@
+import collections
+import itertools
+import constants
+import numpy as np
+
+""" Columnar run table
+
+Holds the rows of one sequence of a log file as one array per column instead of one dictionary per row.
+Numeric columns are stored as float64 arrays (blank cells become NaN) and text columns such as the
+Workflow/SmDrying states and the DigOut bit strings are stored as integer codes into a list of their unique values.
+"""
+
+# Columns that are always kept as text even if every value looks like a number (DigOut bit strings for example).
+textColumns = {
+    constants.Column.timeStamp.value,
+    constants.Column.workState.value,
+    constants.Column.workState_oldName.value,
+    constants.Column.dryState.value,
+    constants.Column.dryState_oldName.value,
+    constants.Column.digitalOut.value,
+    constants.Column.digatlOut_oldName.value,
+}
+
+# Statistics of one column over an interval, see RunTable.intervalStatistics. Values are NaN when they can't be calculated.
+ColumnStats = collections.namedtuple('ColumnStats', ['minimum', 'maximum', 'mean', 'stdev', 'count'])
+
+
+class EncodedColumn:
+    ''' Text column stored as integer codes into the list of unique values (categories) of the column '''
+    def __init__(self, codes, categories, lookup=None):
+        self.codes = codes # int32 array with one code per row
+        self.categories = categories # list of unique strings, codes index into this list
+        self.lookup = lookup if lookup is not None else dict(zip(categories, itertools.count())) # string -> code
+
+    @classmethod
+    def fromValues(cls, values):
+        ''' Encode the given list of strings. Categories are in order of first appearance. '''
+        lookup = dict(zip(dict.fromkeys(values), itertools.count()))
+        codes = np.fromiter(map(lookup.__getitem__, values), dtype=np.int32, count=len(values))
+        return cls(codes, list(lookup), lookup)
+
+    @classmethod
+    def concatenate(cls, parts):
+        ''' Join EncodedColumns one after another, merging their categories. '''
+        lookup = {}
+        codes = []
+        for part in parts:
+            remap = np.array([lookup.setdefault(value, len(lookup)) for value in part.categories], dtype=np.int32)
+            codes.append(remap[part.codes] if len(remap) else part.codes)
+        return cls(np.concatenate(codes) if codes else np.empty(0, dtype=np.int32), list(lookup))
+
+    def code(self, value):
+        ''' Return the code for value or -1 if value never occurs in this column. '''
+        return self.lookup.get(value, -1)
+
+    def equals(self, value):
+        ''' Return a boolean array that is true for every row equal to value. '''
+        return self.codes == self.code(value)
+
+    def __getitem__(self, ind):
+        return self.categories[self.codes[ind]]
+
+    def __len__(self):
+        return len(self.codes)
+
+
+class RunTable:
+    ''' Columnar storage for the rows of a single sequence. '''
+    def __init__(self, headers, columns):
+        self.headers = headers # Column names in the order of the input file.
+        self.columns = columns # Column name -> float64 array or EncodedColumn.
+        self.length = len(columns[headers[0]]) if headers else 0
+
+    def __len__(self):
+        return self.length
+
+    def has(self, key):
+        return key in self.columns
+
+    def isNumeric(self, key):
+        return isinstance(self.columns[key], np.ndarray)
+
+    def numeric(self, key):
+        ''' Return the float64 array for the numeric column key. Raises KeyError if missing and TypeError if text. '''
+        column = self.columns[key]
+        if not isinstance(column, np.ndarray):
+            raise TypeError("Column " + key + " is not numeric")
+        return column
+
+    def text(self, key):
+        ''' Return the EncodedColumn for the text column key. Raises KeyError if missing and TypeError if numeric. '''
+        column = self.columns[key]
+        if not isinstance(column, EncodedColumn):
+            raise TypeError("Column " + key + " is not text")
+        return column
+
+    def value(self, ind, key):
+        ''' Return the value in row ind of column key as a float or string. Blank numeric cells are returned as "". '''
+        column = self.columns[key]
+        if isinstance(column, EncodedColumn):
+            return column[ind]
+        value = float(column[ind])
+        return "" if np.isnan(value) else value
+
+    def rowValues(self, ind):
+        ''' Return the values of row ind in header order. '''
+        return [self.value(ind, key) for key in self.headers]
+
+    def intervalStatistics(self, startInd, endInd, columns, mask=None):
+        '''
+        Return a dictionary from constants.Column to ColumnStats for the rows startInd to endInd (inclusive).
+
+        All columns are reduced together in one vectorized pass. Columns that are missing from the table or aren't numeric are
+        left out of the result. If mask is given (a boolean array over the interval) only the rows where it is true are counted.
+        A blank value in the interval makes every statistic of that column NaN, as does an interval with too few rows.
+        '''
+        present = [column for column in columns if self.has(column.value) and self.isNumeric(column.value)]
+        if not present:
+            return {}
+        values = np.stack([self.columns[column.value][startInd:endInd + 1] for column in present])
+        if mask is not None:
+            values = values[:, mask]
+        count = values.shape[1]
+        missing = np.full(len(present), np.nan)
+        if count == 0:
+            minimum, maximum, mean = missing, missing, missing
+        else:
+            minimum, maximum, mean = values.min(axis=1), values.max(axis=1), values.mean(axis=1)
+        stdev = values.std(axis=1, ddof=1) if count > 1 else missing
+        return {column : ColumnStats(float(minimum[ind]), float(maximum[ind]), float(mean[ind]), float(stdev[ind]), count)
+            for ind, column in enumerate(present)}
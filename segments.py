@@ -0,0 +1,107 @@
+import constants
+import numpy as np
+
+""" State segment index
+
+Index of every contiguous run (segment) of each value of the Workflow and SmDrying state columns of a RunTable,
+and of the runs where the PV05/PV07 bits of DigOut are set. It is built once per sequence from the encoded columns
+so every interval lookup is a binary search instead of a scan over the rows.
+"""
+
+PV05Bit = 5 # Index of the PV05 bit in the DigOut bit string
+PV07Bit = 7 # Index of the PV07 bit in the DigOut bit string
+bitSetString = '1' # The character of a set bit in the DigOut bit string
+
+
+def findRuns(mask):
+    ''' Return (in order) arrays of the start and end indices (inclusive) of every run of true values in the boolean array mask. '''
+    padded = np.concatenate(([False], mask, [False]))
+    edges = np.flatnonzero(padded[1:] != padded[:-1])
+    return edges[0::2], edges[1::2] - 1
+
+
+def overlapping(starts, ends, lo, hi):
+    ''' Return the range of positions in the sorted, non-overlapping runs starts/ends that overlap lo to hi (inclusive). '''
+    return range(int(np.searchsorted(ends, lo, 'left')), int(np.searchsorted(starts, hi, 'right')))
+
+
+class StateSegments:
+    ''' Every contiguous segment of each value of one encoded state column, including repeated visits of the same state '''
+    def __init__(self, column):
+        self.column = column # EncodedColumn the segments were built from
+        codes = column.codes
+        changes = np.flatnonzero(codes[1:] != codes[:-1]) + 1
+        starts = np.concatenate(([0], changes))
+        ends = np.concatenate((changes - 1, [len(codes) - 1]))
+        segmentCodes = codes[starts]
+        self.starts = {} # State value -> start indices of its segments in ascending order
+        self.ends = {} # State value -> end indices (inclusive) of its segments in ascending order
+        for code, value in enumerate(column.categories):
+            selected = segmentCodes == code
+            self.starts[value] = starts[selected]
+            self.ends[value] = ends[selected]
+
+    def segments(self, value, lo, hi):
+        ''' Return a list of (start, end) for every segment of value that overlaps lo to hi, clipped to that interval. '''
+        if value not in self.starts:
+            return []
+        starts, ends = self.starts[value], self.ends[value]
+        return [(max(int(starts[ind]), lo), min(int(ends[ind]), hi)) for ind in overlapping(starts, ends, lo, hi)]
+
+    def first(self, value, lo, hi):
+        ''' Return (in order) the start and end of the first segment of value within lo to hi. Raises KeyError if there is none. '''
+        found = self.segments(value, lo, hi)
+        if not found:
+            raise KeyError(value)
+        return found[0]
+
+    def last(self, value, lo, hi):
+        ''' Return (in order) the start and end of the last segment of value within lo to hi. Raises KeyError if there is none. '''
+        found = self.segments(value, lo, hi)
+        if not found:
+            raise KeyError(value)
+        return found[-1]
+
+    def mask(self, value, lo, hi):
+        ''' Return a boolean array over lo to hi that is true for the rows in a segment of value. '''
+        result = np.zeros(hi - lo + 1, dtype=bool)
+        for start, end in self.segments(value, lo, hi):
+            result[start - lo:end - lo + 1] = True
+        return result
+
+
+class SegmentIndex:
+    ''' Segments of the work and dry states and run-length encoded PV05/PV07 bits for one RunTable '''
+    def __init__(self, table):
+        self.workState = self.stateSegments(table, constants.Column.workState, constants.Column.workState_oldName)
+        self.dryState = self.stateSegments(table, constants.Column.dryState, constants.Column.dryState_oldName)
+        self.bitRuns = {} # (bit index, bit index, ...) -> (starts, ends) of the runs where all of the bits are set
+        self.bitMasks = {} # bit index -> boolean array that is true where the bit is set
+        digitalOut = self.findColumn(table, constants.Column.digitalOut, constants.Column.digatlOut_oldName)
+        if digitalOut is not None:
+            for bit in (PV05Bit, PV07Bit):
+                isSet = np.array([len(value) > bit and value[bit] == bitSetString for value in digitalOut.categories], dtype=bool)
+                self.bitMasks[bit] = isSet[digitalOut.codes] if len(isSet) else np.zeros(len(digitalOut), dtype=bool)
+            for bits in ((PV05Bit,), (PV07Bit,), (PV05Bit, PV07Bit)):
+                self.bitRuns[bits] = findRuns(np.logical_and.reduce([self.bitMasks[bit] for bit in bits]))
+
+    @staticmethod
+    def findColumn(table, column, oldColumn):
+        ''' Return the EncodedColumn for column, or for its past name oldColumn, or None if neither is in table. '''
+        for key in (column.value, oldColumn.value):
+            if table.has(key):
+                return table.text(key)
+        return None
+
+    @classmethod
+    def stateSegments(cls, table, column, oldColumn):
+        column = cls.findColumn(table, column, oldColumn)
+        return StateSegments(column) if column is not None else None
+
+    def firstBitRun(self, bits, lo, hi):
+        ''' Return (in order) the start and end of the first run within lo to hi where all of bits are set, or None if there is none. Raises KeyError if DigOut is missing. '''
+        starts, ends = self.bitRuns[bits]
+        found = overlapping(starts, ends, lo, hi)
+        if len(found) == 0:
+            return None
+        return max(int(starts[found[0]]), lo), min(int(ends[found[0]]), hi)
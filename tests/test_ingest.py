@@ -0,0 +1,31 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import converters
+import ingest
+
+
+def test_auto_column_split_across_numeric_and_text_chunks_keeps_source_text(monkeypatch):
+    monkeypatch.setattr(ingest, "chunkRows", 2)
+    headers = ["id", "Comment"]
+    buffer = ingest.SequenceBuffer(headers, converters.ColumnSchema(headers))
+    for fields in (["1", "12"], ["2", ""], ["3", "note"], ["4", "7.50"]):
+        buffer.append(fields)
+
+    table = buffer.toTable()
+
+    assert [table.value(ind, "Comment") for ind in range(4)] == ["12", "", "note", "7.50"]
+
+
+def test_auto_column_with_only_numbers_is_numeric(monkeypatch):
+    monkeypatch.setattr(ingest, "chunkRows", 2)
+    headers = ["id", "Comment"]
+    buffer = ingest.SequenceBuffer(headers, converters.ColumnSchema(headers))
+    for fields in (["1", "12"], ["2", ""], ["3", "4.5"]):
+        buffer.append(fields)
+
+    column = buffer.toTable().numeric("Comment")
+
+    assert column[0] == 12 and column[2] == 4.5 and column[1] != column[1]
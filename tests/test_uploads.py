@@ -0,0 +1,27 @@
+import io
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import uploads
+import workspace
+
+
+def test_chunks_after_complete_are_rejected(tmp_path):
+    manager = uploads.UploadManager(workspace.WorkspaceManager(str(tmp_path), 3600, 600), 3600)
+    upload = manager.create("log.csv", 4)
+    with pytest.raises(uploads.IncompleteUploadError):
+        manager.complete(upload)
+    upload.append(io.BytesIO(b"id\n1"), 0, 100)
+    manager.complete(upload)
+
+    with pytest.raises(uploads.UploadFinishedError):
+        upload.append(io.BytesIO(b"\n2"), 4, 100)
+    with pytest.raises(uploads.UploadFinishedError):
+        manager.complete(upload)
+    assert manager.get(upload.id) is None
+    with open(upload.path, 'rb') as fp:
+        assert fp.read() == b"id\n1"
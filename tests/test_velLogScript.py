@@ -0,0 +1,38 @@
+import csv
+import os
+import sys
+
+repoDir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, repoDir)
+sys.path.insert(0, os.path.join(repoDir, "benchmarks"))
+
+import constants
+import synthetic
+import velLogScript
+
+
+def blankLastTime(path, seqId, workState):
+    ''' Blank the TimeSec of the last row of seqId in the WorkSM state workState. '''
+    with open(path, newline='') as fp:
+        rows = list(csv.reader(fp))
+    header = rows[0]
+    timeIndex = header.index(constants.Column.time.value)
+    workIndex = header.index(constants.Column.workState.value)
+    seqIndex = header.index("SeqId")
+    last = max(ind for ind, row in enumerate(rows[2:], 2) if row[seqIndex] == str(seqId) and row[workIndex] == workState)
+    rows[last][timeIndex] = ""
+    with open(path, 'w', newline='') as fp:
+        csv.writer(fp).writerows(rows)
+
+
+def test_blank_time_at_segment_boundary_gives_error_output(tmp_path):
+    path = str(tmp_path / "log.csv")
+    synthetic.writeLog(path, sequences=1, dryingMinutes=2, sampleSeconds=1)
+    blankLastTime(path, 12, constants.WorkState.unlockDoor.value)
+
+    results = velLogScript.velLogScript().main(path, inMemory=True)
+
+    assert [result.error for result in results] == [None]
+    summary = results[0].summaries[0]
+    assert summary[constants.SummaryKey.run_duration_key.value] == constants.Output.error.value
+    assert results[0].workbook
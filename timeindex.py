@@ -0,0 +1,42 @@
+import numpy as np
+
+""" TimeSec window lookups
+
+Answers "first/last N seconds of an interval" queries with a binary search over the TimeSec column of a RunTable.
+The search needs TimeSec to be non-decreasing. Logs where it isn't (rows written out of order, blank times) are
+repaired for searching by carrying the latest time forward, so a step back in time is treated as no time passing.
+"""
+
+
+class TimeIndex:
+    ''' Binary search time windows over a TimeSec array '''
+    def __init__(self, times):
+        self.times = times # The original TimeSec values
+        self.outOfOrder = 0 # Number of rows whose time is blank or earlier than a previous row
+        self.searchTimes = times # Non-decreasing times used for searching
+        steps = np.diff(times)
+        invalid = int(np.count_nonzero(steps < 0)) + int(np.count_nonzero(np.isnan(times)))
+        if invalid > 0:
+            self.outOfOrder = invalid
+            self.searchTimes = self.repair(times)
+            print("Warning: " + str(invalid) + " rows have a blank TimeSec or go back in time, treating them as no time passing for time windows.")
+
+    @staticmethod
+    def repair(times):
+        ''' Return a non-decreasing copy of times where each value is the latest time seen so far. Leading blanks take the first time. '''
+        repaired = np.fmax.accumulate(times)
+        valid = np.flatnonzero(~np.isnan(repaired))
+        if len(valid) == 0:
+            return np.zeros(len(times))
+        repaired[:valid[0]] = repaired[valid[0]]
+        return repaired
+
+    def firstSeconds(self, startInd, endInd, seconds):
+        ''' Return the index for the last row within seconds of startInd that is within endInd. '''
+        window = self.searchTimes[startInd:endInd + 1]
+        return startInd + int(np.searchsorted(window, self.searchTimes[startInd] + seconds, 'right')) - 1
+
+    def lastSeconds(self, startInd, endInd, seconds):
+        ''' Return the index for the first row within seconds before endInd that is within startInd. '''
+        window = self.searchTimes[startInd:endInd + 1]
+        return startInd + int(np.searchsorted(window, self.searchTimes[endInd] - seconds, 'left'))
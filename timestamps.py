@@ -0,0 +1,88 @@
+import datetime
+import re
+import numpy as np
+
+""" Timestamp parsing
+
+Parses the TimeStamp column of a RunTable to whole seconds since 1970 once per sequence instead of calling strptime
+twice for every row. Only the distinct timestamp strings of the encoded column are parsed: the ones in the usual
+"%Y-%m-%d %H:%M:%S" format in one vectorized numpy conversion and the rest with strptime, trying the format that
+last worked first and remembering every result. Run boundaries are then found with integer differences.
+"""
+
+dateTimeFormat = "%Y-%m-%d %H:%M:%S"
+dateTimeFormat2 = "%m/%d/%Y %H:%M" # Different log files had different formats sometimes even when looking the same in text editor
+# Strings numpy's datetime64 parses exactly like strptime with dateTimeFormat. Year 0 is left to strptime, which rejects it.
+isoPattern = re.compile(r"(?!0000)\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}")
+epoch = datetime.datetime(1970, 1, 1)
+newRunSeconds = 2 * 60 # Minimum number of seconds between two consecutive timestamps that indicates a new run.
+secondsPerDay = 24 * 60 * 60
+
+
+def isNewRun(difference):
+    '''
+    Return true where the difference in seconds between consecutive timestamps indicates a different run.
+
+    Works on a single integer or an array. Matches comparing datetime.timedelta days and seconds: a step of a day or
+    more, or of newRunSeconds or more within the day, and any step back in time by less than a day.
+    '''
+    return (difference // secondsPerDay > 0) | (difference % secondsPerDay >= newRunSeconds)
+
+
+class TimestampParser:
+    ''' Parses timestamp strings to seconds since 1970, detecting the format once and caching every parsed string '''
+    def __init__(self):
+        self.formats = [dateTimeFormat, dateTimeFormat2] # Formats to try, the one that worked last first
+        self.cache = {} # Timestamp string -> seconds since 1970 or None if it couldn't be parsed
+        self.failed = 0 # Number of distinct strings that couldn't be parsed
+
+    def seconds(self, timeStamp):
+        ''' Return the whole seconds since 1970 of timeStamp or None if it isn't in a known format. '''
+        if timeStamp in self.cache:
+            return self.cache[timeStamp]
+        result = None
+        for ind, dateTimeFormat in enumerate(self.formats):
+            try:
+                parsed = datetime.datetime.strptime(timeStamp, dateTimeFormat)
+            except (TypeError, ValueError):
+                continue
+            if ind > 0:
+                self.formats.insert(0, self.formats.pop(ind))
+            result = (parsed - epoch) // datetime.timedelta(seconds=1)
+            break
+        if result is None:
+            self.failed += 1
+        self.cache[timeStamp] = result
+        return result
+
+    def parseColumn(self, column):
+        ''' Return (in order) an int64 array of the seconds since 1970 of each row of the EncodedColumn column and a boolean array that is false where it couldn't be parsed. '''
+        categories = column.categories
+        values = np.zeros(len(categories), dtype=np.int64)
+        valid = np.zeros(len(categories), dtype=bool)
+        remaining = range(len(categories))
+        if self.formats[0] == dateTimeFormat:
+            iso = [ind for ind in remaining if categories[ind] not in self.cache and isoPattern.fullmatch(categories[ind])]
+            try:
+                values[iso] = np.array([categories[ind] for ind in iso], dtype='datetime64[s]').astype(np.int64)
+                valid[iso] = True
+                remaining = np.flatnonzero(~valid)
+            except ValueError: # An impossible date like the 30th of February, parse these one by one.
+                pass
+        for ind in remaining:
+            result = self.seconds(categories[ind])
+            if result is not None:
+                values[ind] = result
+                valid[ind] = True
+        return values[column.codes], valid[column.codes]
+
+    def newRunRows(self, column):
+        ''' Return a boolean array that is true for every row of the EncodedColumn column whose timestamp starts a new run compared to the previous row. The first row always does and rows with a timestamp that can't be parsed never do after it. '''
+        failedBefore = self.failed
+        values, valid = self.parseColumn(column)
+        if self.failed > failedBefore:
+            print("\nThere were " + str(self.failed - failedBefore) + " timestamps that couldn't be parsed. Assuming these timestamps aren't for a different run.")
+            print("Expected format for date is " + dateTimeFormat + " or " + dateTimeFormat2)
+        result = np.ones(len(values), dtype=bool)
+        result[1:] = valid[1:] & valid[:-1] & isNewRun(np.diff(values))
+        return result
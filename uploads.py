@@ -0,0 +1,170 @@
+import hashlib
+import os
+import threading
+import time
+import uuid
+
+""" Streamed and resumable uploads
+
+Writes uploaded log files to disk a block at a time while hashing them and counting their rows, so an upload is never
+held in memory and doesn't have to be read again to find its cache key. Large files can be sent as a series of chunks
+to an Upload, each appended at the offset the previous one ended at. If a chunk fails part way the upload keeps every
+complete block, and the client asks for the offset and sends the rest from there instead of starting over.
+
+Uploads that are started but not finished are discarded after maxAgeSeconds without a chunk.
+"""
+
+blockBytes = 1024 * 1024 # Number of bytes read from the request and written to disk at a time
+
+
+class UploadTooLargeError(Exception):
+    ''' Raised when an upload would grow past the size limit. '''
+
+
+class UploadFinishedError(Exception):
+    ''' Raised when a chunk arrives for an upload that was already completed or discarded. '''
+
+
+class IncompleteUploadError(Exception):
+    ''' Raised when an upload is completed before every byte of its declared size has been received. '''
+
+
+class OffsetMismatchError(Exception):
+    ''' Raised when a chunk doesn't start where the upload currently ends. expected is the offset it should start at. '''
+    def __init__(self, expected):
+        super().__init__("Upload continues at offset " + str(expected))
+        self.expected = expected
+
+
+class Upload:
+    ''' A file being received into a workspace, with the SHA-256 and line count of what has been received so far '''
+    def __init__(self, workspace, filename, size=None):
+        self.id = uuid.uuid4().hex
+        self.workspace = workspace # Held by the upload until it is finished or discarded
+        self.filename = filename
+        self.path = os.path.join(workspace.uploadDir, filename)
+        self.size = size # Declared total size in bytes, None if the client didn't say
+        self.received = 0 # Bytes written so far, the offset the next chunk starts at
+        self.digest = hashlib.sha256()
+        self.newlines = 0
+        self.endsWithNewline = True # Whether the last byte received is a newline, so an empty file has no partial row
+        self.countsRows = filename.lower().endswith(".csv") # Lines of compressed logs can't be counted without decompressing them
+        self.lastUsed = time.time()
+        self.lock = threading.Lock() # Held while a chunk is written or the upload is finished
+        self.finished = False # Set once the upload is completed or discarded, after which no chunk is written
+        open(self.path, 'wb').close()
+
+    def append(self, stream, offset, maxBytes):
+        '''
+        Append everything read from the binary stream to the file if offset is where the file currently ends. Returns the new offset.
+
+        Raises OffsetMismatchError if offset is wrong, UploadFinishedError if the upload was completed or discarded and
+        UploadTooLargeError if the file would grow past maxBytes. If reading or writing fails the file is cut back to the
+        last complete block, which is where the next chunk starts.
+        '''
+        with self.lock:
+            if self.finished:
+                raise UploadFinishedError("Upload was already completed or discarded")
+            if offset != self.received:
+                raise OffsetMismatchError(self.received)
+            self.lastUsed = time.time()
+            with open(self.path, 'r+b') as fp:
+                fp.seek(self.received)
+                try:
+                    for block in iter(lambda: stream.read(blockBytes), b""):
+                        if self.received + len(block) > maxBytes or (self.size is not None and self.received + len(block) > self.size):
+                            raise UploadTooLargeError("Upload is larger than " + str(min(maxBytes, self.size or maxBytes)) + " bytes")
+                        fp.write(block)
+                        self.digest.update(block)
+                        self.newlines += block.count(b"\n")
+                        self.endsWithNewline = block.endswith(b"\n")
+                        self.received += len(block)
+                finally:
+                    fp.truncate(self.received)
+            self.lastUsed = time.time()
+            return self.received
+
+    def isComplete(self):
+        ''' Whether every byte of the declared size has been received. Always true if no size was declared. '''
+        return self.size is None or self.received == self.size
+
+    def contentHash(self):
+        ''' Return the hex SHA-256 of the bytes received so far. '''
+        return self.digest.hexdigest()
+
+    def rows(self):
+        ''' Return the number of lines received after the header line, or None for a compressed log. Quoted line breaks inside a field count as rows. '''
+        if not self.countsRows:
+            return None
+        lines = self.newlines + (0 if self.endsWithNewline else 1)
+        return max(lines - 1, 0)
+
+    def status(self):
+        return {"id": self.id, "filename": self.filename, "offset": self.received, "size": self.size, "rows": self.rows()}
+
+
+class UploadManager:
+    ''' Uploads in progress by ID '''
+    def __init__(self, workspaces, maxAgeSeconds):
+        self.workspaces = workspaces # workspace.WorkspaceManager the uploads are saved in
+        self.maxAgeSeconds = maxAgeSeconds # Seconds an upload is kept without receiving a chunk
+        self.lock = threading.Lock()
+        self.uploads = {} # Upload ID -> Upload
+
+    def create(self, filename, size=None):
+        ''' Start an upload of filename into a new workspace and return it. '''
+        self.prune()
+        upload = Upload(self.workspaces.create(), filename, size)
+        with self.lock:
+            self.uploads[upload.id] = upload
+        return upload
+
+    def get(self, uploadId):
+        ''' Return the upload with the ID uploadId or None if there is none or it expired. '''
+        with self.lock:
+            return self.uploads.get(uploadId)
+
+    def complete(self, upload):
+        '''
+        Finish upload if every byte of its declared size has been received. The caller takes over its reference to the workspace.
+
+        The check and the finish happen under the lock of the upload, so no chunk can be written after them. Raises
+        IncompleteUploadError if bytes are missing and UploadFinishedError if it was already finished or discarded.
+        '''
+        with upload.lock:
+            if upload.finished:
+                raise UploadFinishedError("Upload was already completed or discarded")
+            if not upload.isComplete():
+                raise IncompleteUploadError("Upload is missing " + str(upload.size - upload.received) + " bytes")
+            upload.finished = True
+        self.forget(upload)
+
+    def finish(self, upload):
+        ''' Stop tracking upload and accepting chunks for it. The caller takes over its reference to the workspace. Returns false if it was already finished or discarded. '''
+        with upload.lock: # Waits for a chunk that is still being written
+            if upload.finished:
+                return False
+            upload.finished = True
+        self.forget(upload)
+        return True
+
+    def forget(self, upload):
+        with self.lock:
+            self.uploads.pop(upload.id, None)
+
+    def discard(self, upload):
+        ''' Stop tracking upload and delete its workspace. '''
+        if self.finish(upload):
+            self.workspaces.discard(upload.workspace)
+
+    def prune(self):
+        ''' Discard uploads that haven't received a chunk for maxAgeSeconds. '''
+        cutoff = time.time() - self.maxAgeSeconds
+        with self.lock:
+            expired = [upload for upload in self.uploads.values() if upload.lastUsed < cutoff and not upload.lock.locked()]
+        for upload in expired:
+            self.discard(upload)
+
+    def activeCount(self):
+        with self.lock:
+            return len(self.uploads)
@@ -0,0 +1,134 @@
+import os
+import shutil
+import threading
+import time
+import uuid
+
+""" Job workspaces
+
+Every upload gets its own workspace: an uploads and a downloads folder under the workspace root, named after the
+workspace ID. Whoever uses a workspace (the request saving the file, the job analyzing it, the response sending the
+result) holds a reference to it. The sweeper only deletes the folders of workspaces that nobody holds and that haven't
+been used for maxAgeSeconds, one workspace at a time, so cleaning up never touches the files of an active job.
+Folders left behind by a previous run of the server are deleted on startup and by age afterwards.
+"""
+
+
+class Workspace:
+    ''' Upload and download folders of one job '''
+    def __init__(self, root):
+        self.id = uuid.uuid4().hex
+        self.uploadDir = os.path.join(root, "uploads", self.id)
+        self.downloadDir = os.path.join(root, "downloads", self.id)
+        self.refs = 0 # Number of holders, guarded by the lock of the WorkspaceManager
+        self.lastUsed = time.time()
+
+
+class WorkspaceManager:
+    ''' Creates workspaces, counts their references and sweeps unused ones on a background thread '''
+    def __init__(self, root, maxAgeSeconds, sweepIntervalSeconds):
+        self.root = root
+        self.maxAgeSeconds = maxAgeSeconds # Seconds an unreferenced workspace is kept after it was last used
+        self.sweepIntervalSeconds = sweepIntervalSeconds
+        self.lock = threading.Lock()
+        self.workspaces = {} # Workspace ID -> Workspace
+        self.stopEvent = threading.Event()
+        self.sweeper = None
+        self.sweeps = 0 # Number of sweeps run
+        self.swept = 0 # Number of workspaces deleted by sweeps
+        self.sweepErrors = 0 # Number of sweeps that failed
+        self.beforeSweep = [] # Functions called before every periodic sweep to release the workspaces of abandoned work
+        for folder in ("uploads", "downloads"):
+            os.makedirs(os.path.join(root, folder), exist_ok=True)
+        self.sweep(maxAgeSeconds=0) # Nothing is registered yet, so this removes everything left from a previous run
+
+    def create(self):
+        ''' Return a new Workspace with its folders created and one reference held by the caller. '''
+        workspace = Workspace(self.root)
+        os.makedirs(workspace.uploadDir)
+        os.makedirs(workspace.downloadDir)
+        with self.lock:
+            workspace.refs = 1
+            self.workspaces[workspace.id] = workspace
+        return workspace
+
+    def acquire(self, workspaceId):
+        ''' Add a reference to the workspace with the ID workspaceId and return it, or None if it has been swept. '''
+        with self.lock:
+            workspace = self.workspaces.get(workspaceId)
+            if workspace is not None:
+                workspace.refs += 1
+                workspace.lastUsed = time.time()
+            return workspace
+
+    def release(self, workspace):
+        ''' Drop a reference to workspace. It is swept once it has no references and is older than maxAgeSeconds. '''
+        with self.lock:
+            workspace.refs -= 1
+            workspace.lastUsed = time.time()
+
+    def discard(self, workspace):
+        ''' Drop a reference to workspace and delete it right away if nobody else holds it. '''
+        with self.lock:
+            workspace.refs -= 1
+            if workspace.refs > 0:
+                return
+            del self.workspaces[workspace.id]
+        self.remove(workspace.id)
+
+    def activeCount(self):
+        ''' Return the number of workspaces that are in use. '''
+        with self.lock:
+            return sum(1 for workspace in self.workspaces.values() if workspace.refs > 0)
+
+    def remove(self, workspaceId):
+        for folder in ("uploads", "downloads"):
+            shutil.rmtree(os.path.join(self.root, folder, workspaceId), ignore_errors=True)
+
+    def sweep(self, maxAgeSeconds=None):
+        ''' Delete the folders of unreferenced workspaces last used more than maxAgeSeconds ago and of unknown folders that old. Returns the number of workspaces deleted. '''
+        if maxAgeSeconds is None:
+            maxAgeSeconds = self.maxAgeSeconds
+        cutoff = time.time() - maxAgeSeconds
+        with self.lock:
+            expired = [workspaceId for workspaceId, workspace in self.workspaces.items() if workspace.refs <= 0 and workspace.lastUsed <= cutoff]
+            for workspaceId in expired:
+                del self.workspaces[workspaceId]
+            known = set(self.workspaces)
+        # Folders without a registered workspace, left by a crash or a previous run of the server
+        orphans = set()
+        for folder in ("uploads", "downloads"):
+            for name in os.listdir(os.path.join(self.root, folder)):
+                path = os.path.join(self.root, folder, name)
+                try:
+                    if name not in known and os.path.getmtime(path) < cutoff:
+                        orphans.add(name)
+                except OSError: # Removed while listing
+                    pass
+        for workspaceId in expired + list(orphans - set(expired)):
+            self.remove(workspaceId)
+        with self.lock:
+            self.sweeps += 1
+            self.swept += len(expired) + len(orphans - set(expired))
+        return len(expired) + len(orphans - set(expired))
+
+    def start(self):
+        ''' Start sweeping every sweepIntervalSeconds on a daemon thread. '''
+        if self.sweeper is None:
+            self.sweeper = threading.Thread(name="Cleaner", target=self.sweepPeriodically, daemon=True)
+            self.sweeper.start()
+
+    def stop(self):
+        self.stopEvent.set()
+
+    def sweepPeriodically(self):
+        while not self.stopEvent.wait(self.sweepIntervalSeconds):
+            try:
+                print("Sweeping unused workspaces")
+                for release in self.beforeSweep:
+                    release()
+                self.sweep()
+            except Exception as e: # Keep sweeping later, a failed sweep leaves folders for the next one.
+                print("Error sweeping workspaces: " + repr(e))
+                with self.lock:
+                    self.sweepErrors += 1